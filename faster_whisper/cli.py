@@ -66,6 +66,7 @@ from faster_whisper import (
 )
 from faster_whisper.transcribe import Segment
 from faster_whisper.utils import format_timestamp
+from faster_whisper.vad import VadCache
 
 
 def _infer_format_from_path(output_path: Optional[str]) -> str:
@@ -148,12 +149,23 @@ def _write_jsonl(segments: Iterable[Segment], fp):
         fp.write(json.dumps(_segment_to_dict(seg), ensure_ascii=False) + "\n")
 
 
+def _positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"必须大于 0：{value}")
+    return number
+
+
 def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Faster-Whisper CLI (CPU 默认), 将音频转写为文本/字幕。",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
-    parser.add_argument("input", help="输入音频文件路径")
+    parser.add_argument(
+        "input",
+        nargs="+",
+        help="输入音频文件路径（仅 --detect-language-only 模式支持多个输入）",
+    )
     parser.add_argument(
         "--output",
         "-o",
@@ -188,6 +200,18 @@ def build_arg_parser() -> argparse.ArgumentParser:
     parser.add_argument("--word-timestamps", action="store_true", help="输出词级时间戳")
     parser.add_argument("--multilingual", action="store_true", help="逐段语言检测（多语模型）")
     parser.add_argument("--hotwords", help="热词提示，提升特定词识别概率")
+    # 仅语言检测
+    parser.add_argument(
+        "--detect-language-only",
+        action="store_true",
+        help="仅检测语言：取每个输入（VAD 过滤后）的前若干秒语音批量检测，每个输入输出一行 JSON",
+    )
+    parser.add_argument(
+        "--detect-seconds",
+        type=_positive_float,
+        default=30.0,
+        help="语言检测使用的语音秒数（最多 30）",
+    )
     # VAD（默认启用，可用 --no-vad-filter 关闭）
     vad_group = parser.add_mutually_exclusive_group()
     vad_group.add_argument(
@@ -207,6 +231,10 @@ def build_arg_parser() -> argparse.ArgumentParser:
         "--vad-params",
         help="VAD 参数，JSON 字符串，例如 '{\"min_silence_duration_ms\": 500}'",
     )
+    parser.add_argument(
+        "--vad-cache-dir",
+        help="VAD 结果缓存目录；重复处理相同音频（且 VAD 参数相同）时跳过 VAD",
+    )
     # 批量/速度
     parser.add_argument("--batch-size", type=int, default=8, help="批量推理大小（>1 使用批量管线）")
     parser.add_argument("--chunk-length", type=int, help="音频分块长度（秒）")
@@ -263,7 +291,12 @@ def _open_output(path: Optional[str]):
 
 
 def main(argv: Optional[list] = None) -> int:
-    args = build_arg_parser().parse_args(argv)
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if not args.detect_language_only:
+        if len(args.input) > 1:
+            parser.error("仅 --detect-language-only 模式支持多个输入")
+        args.input = args.input[0]
 
     output_format = args.format or _infer_format_from_path(args.output)
 
@@ -335,6 +368,7 @@ def main(argv: Optional[list] = None) -> int:
             "word_timestamps": args.word_timestamps,
             "without_timestamps": args.without_timestamps,
             "multilingual": args.multilingual,
+            "detect_language_only": args.detect_language_only,
             "beam_size": args.beam_size,
             "best_of": args.best_of,
             "temperature": args.temperature,
@@ -361,7 +395,7 @@ def main(argv: Optional[list] = None) -> int:
     )
     _emit_log("debug", "模型初始化完成", {"took_seconds": round(time.time() - t0, 3)})
 
-    use_batched = args.batch_size and args.batch_size > 1
+    use_batched = args.batch_size and args.batch_size > 1 and not args.detect_language_only
     pipeline = None
     if use_batched:
         t1 = time.time()
@@ -377,6 +411,83 @@ def main(argv: Optional[list] = None) -> int:
             print(f"VAD 参数解析失败: {e}", file=sys.stderr)
             return 2
 
+    vad_cache = None
+    if args.vad_cache_dir:
+        vad_cache = VadCache(_resolve_path(args.vad_cache_dir))
+
+    if args.detect_language_only:
+        # 仅语言检测：跨文件批量编码，每个输入输出一行 JSON
+        input_paths = [_resolve_path(path) for path in args.input]
+        detect_batch_size = max(args.batch_size or 1, 1)
+        _emit_log(
+            "info",
+            "开始语言检测",
+            {
+                "files": len(input_paths),
+                "batch_size": detect_batch_size,
+                "detect_seconds": args.detect_seconds,
+            },
+        )
+        t2 = time.time()
+        file_count = 0
+        results = model.detect_language_batch(
+            input_paths,
+            speech_seconds=args.detect_seconds,
+            vad_filter=args.vad_filter,
+            vad_parameters=vad_params,
+            batch_size=detect_batch_size,
+            vad_cache=vad_cache,
+        )
+        with _open_output(args.output) as fp:
+            for path, result in zip(args.input, results):
+                file_count += 1
+                if isinstance(result, Exception):
+                    # 单个输入失败时记录错误并继续检测其余输入
+                    _emit_log("error", "语言检测失败", {"input": path, "error": str(result)})
+                    record = {"input": path, "error": str(result)}
+                else:
+                    language, language_probability, all_language_probs = result
+                    record = {
+                        "input": path,
+                        "language": language,
+                        "language_probability": language_probability,
+                        "all_language_probs": dict(all_language_probs),
+                    }
+                fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+                _emit_event(
+                    {
+                        "event": "progress",
+                        "time": _now_iso(),
+                        "elapsed_seconds": round(time.time() - start_ts, 3),
+                        "processed_files": file_count,
+                        "total_files": len(input_paths),
+                        "progress": round(file_count / len(input_paths), 4),
+                    }
+                )
+
+        detect_seconds = time.time() - t2
+        files_per_second = file_count / detect_seconds if detect_seconds > 0 else None
+        end_ts = time.time()
+        _emit_event(
+            {
+                "event": "end",
+                "time": _now_iso(),
+                "elapsed_seconds": round(end_ts - start_ts, 3),
+                "files": file_count,
+                "files_per_second": round(files_per_second, 3) if files_per_second else None,
+            }
+        )
+        _emit_log(
+            "info",
+            "语言检测完成",
+            {
+                "elapsed_seconds": round(end_ts - start_ts, 3),
+                "files": file_count,
+                "files_per_second": round(files_per_second, 3) if files_per_second else None,
+            },
+        )
+        return 0
+
     common_kwargs = dict(
         language=args.language,
         task=args.task,
@@ -394,6 +505,7 @@ def main(argv: Optional[list] = None) -> int:
         multilingual=args.multilingual,
         vad_filter=args.vad_filter,
         vad_parameters=vad_params,
+        vad_cache=vad_cache,
         chunk_length=args.chunk_length,
         hotwords=args.hotwords,
     )
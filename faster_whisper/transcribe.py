@@ -1,13 +1,23 @@
+import bisect
+import collections
+import copy
+import functools
+import hashlib
+import heapq
 import itertools
 import json
 import logging
 import os
+import queue
+import threading
+import time
 import zlib
 
-from dataclasses import asdict, dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
 from inspect import signature
 from math import ceil
-from typing import BinaryIO, Iterable, List, Optional, Tuple, Union
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
 from warnings import warn
 
 import ctranslate2
@@ -19,11 +29,19 @@ from tqdm import tqdm
 from faster_whisper.audio import decode_audio, pad_or_trim
 from faster_whisper.feature_extractor import FeatureExtractor
 from faster_whisper.tokenizer import _LANGUAGE_CODES, Tokenizer
-from faster_whisper.utils import download_model, format_timestamp, get_end, get_logger
+from faster_whisper.utils import (
+    DiskCache,
+    download_model,
+    format_timestamp,
+    get_end,
+    get_logger,
+)
 from faster_whisper.vad import (
     SpeechTimestampsMap,
+    VadCache,
     VadOptions,
     collect_chunks,
+    gather_segments,
     get_speech_timestamps,
 )
 
@@ -95,6 +113,13 @@ class TranscriptionOptions:
     clip_timestamps: Union[str, List[float]]
     hallucination_silence_threshold: Optional[float]
     hotwords: Optional[str]
+    speculative_encode: bool
+    parallel_fallbacks: int
+    max_tokens_per_second: Optional[float]
+    early_no_speech_threshold: Optional[float]
+    loop_probe_length: Optional[int]
+    adaptive_beam: bool
+    language_reuse_threshold: Optional[float]
 
 
 @dataclass
@@ -108,6 +133,115 @@ class TranscriptionInfo:
     vad_options: VadOptions
 
 
+@dataclass
+class CascadeInfo:
+    num_segments: int
+    num_escalated_segments: int
+    escalated_duration: float
+    escalated_ranges: List[Tuple[float, float]]
+
+
+class EncoderOutputCache(DiskCache):
+    """Cache of the encoder outputs of 30-second windows saved as NumPy arrays.
+
+    Entries are keyed by the window features, the model path, the compute type and the
+    device, so that decoding the same audio again with other options skips the encoder.
+    """
+
+    def __init__(
+        self, cache_dir: str, max_size: int = 4 * 1024**3, float16: bool = False
+    ):
+        """Initializes the cache.
+
+        Args:
+          cache_dir: Directory where the encoder outputs are saved. It is created if needed.
+          max_size: Maximum total size of the saved encoder outputs in bytes.
+          float16: Save the encoder outputs in float16 to halve their size.
+        """
+        super().__init__(cache_dir, max_size)
+        self.float16 = float16
+
+    def get_key(self, model: "WhisperModel", features: np.ndarray) -> str:
+        key = hashlib.blake2b(digest_size=20)
+        key.update(os.path.abspath(model.model_path).encode())
+        key.update(
+            b":%s:%s:"
+            % (model.model.compute_type.encode(), model.model.device.encode())
+        )
+        key.update(get_features_digest(features).encode())
+        return key.hexdigest()
+
+    def put(self, key: str, array: np.ndarray) -> None:
+        if self.float16:
+            array = array.astype(np.float16)
+        super().put(key, array)
+
+
+class PromptBuilder:
+    """Assembles the decoder prompts of a transcription.
+
+    The hotwords and the prefix are tokenized once, and the prompt of each window is
+    assembled from the token lists. The start of transcript sequence is cached per
+    language, since it changes with the language detected in multilingual mode.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Tokenizer,
+        max_length: int,
+        without_timestamps: bool = False,
+        prefix: Optional[str] = None,
+        hotwords: Optional[str] = None,
+    ):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.hotwords_tokens = self.encode(hotwords) if hotwords else None
+        self.prefix_tokens = self.encode(prefix) if prefix else None
+
+        self.suffix = [tokenizer.no_timestamps] if without_timestamps else []
+        self.prefix_suffix = (
+            self.suffix
+            + ([] if without_timestamps else [tokenizer.timestamp_begin])
+            + (self.prefix_tokens or [])
+        )
+        self.sot_sequences = {}
+
+    def encode(self, text: str) -> List[int]:
+        tokens = self.tokenizer.encode(" " + text.strip())
+        if len(tokens) >= self.max_length // 2:
+            tokens = tokens[: self.max_length // 2 - 1]
+        return tokens
+
+    def get_prompt(
+        self, previous_tokens: List[int], use_prefix: bool = False
+    ) -> List[int]:
+        """Returns the prompt of a window.
+
+        Args:
+          previous_tokens: Tokens of the previous text.
+          use_prefix: Add the prefix to the prompt. The hotwords are not used in that case.
+        """
+        use_prefix = use_prefix and self.prefix_tokens is not None
+        prompt = []
+
+        hotwords_tokens = None if use_prefix else self.hotwords_tokens
+        if previous_tokens or hotwords_tokens is not None:
+            prompt.append(self.tokenizer.sot_prev)
+            if hotwords_tokens is not None:
+                prompt.extend(hotwords_tokens)
+            if previous_tokens:
+                prompt.extend(previous_tokens[-(self.max_length // 2 - 1) :])
+
+        language = self.tokenizer.language
+        sot_sequence = self.sot_sequences.get(language)
+        if sot_sequence is None:
+            sot_sequence = self.sot_sequences[language] = self.tokenizer.sot_sequence
+        prompt.extend(sot_sequence)
+
+        prompt.extend(self.prefix_suffix if use_prefix else self.suffix)
+        return prompt
+
+
 class BatchedInferencePipeline:
     def __init__(
         self,
@@ -116,9 +250,24 @@ class BatchedInferencePipeline:
         self.model: WhisperModel = model
         self.last_speech_timestamp = 0.0
 
-    def forward(self, features, tokenizer, chunks_metadata, options):
+    def forward(
+        self,
+        features,
+        tokenizer,
+        chunks_metadata,
+        options,
+        encoder_output=None,
+        encoder_cache=None,
+        prompt=None,
+    ):
         encoder_output, outputs = self.generate_segment_batched(
-            features, tokenizer, options
+            features,
+            tokenizer,
+            options,
+            [chunk_metadata["duration"] for chunk_metadata in chunks_metadata],
+            encoder_output,
+            encoder_cache,
+            prompt,
         )
 
         segmented_outputs = []
@@ -145,6 +294,7 @@ class BatchedInferencePipeline:
                         text=tokenizer.decode(subsegment["tokens"]),
                         avg_logprob=output["avg_logprob"],
                         no_speech_prob=output["no_speech_prob"],
+                        temperature=output["temperature"],
                         tokens=subsegment["tokens"],
                         start=subsegment["start"],
                         end=subsegment["end"],
@@ -171,15 +321,11 @@ class BatchedInferencePipeline:
 
         return segmented_outputs
 
-    def generate_segment_batched(
-        self,
-        features: np.ndarray,
-        tokenizer: Tokenizer,
-        options: TranscriptionOptions,
-    ):
-        batch_size = features.shape[0]
-
-        prompt = self.model.get_prompt(
+    def get_prompt(
+        self, tokenizer: Tokenizer, options: TranscriptionOptions
+    ) -> List[int]:
+        """Returns the prompt used for all the chunks of a transcription."""
+        return self.model.get_prompt(
             tokenizer,
             previous_tokens=(
                 tokenizer.encode(options.initial_prompt)
@@ -190,23 +336,23 @@ class BatchedInferencePipeline:
             hotwords=options.hotwords,
         )
 
-        if options.max_new_tokens is not None:
-            max_length = len(prompt) + options.max_new_tokens
-        else:
-            max_length = self.model.max_length
+    def generate_segment_batched(
+        self,
+        features: np.ndarray,
+        tokenizer: Tokenizer,
+        options: TranscriptionOptions,
+        durations: Optional[List[float]] = None,
+        encoder_output: Optional[ctranslate2.StorageView] = None,
+        encoder_cache: Optional[EncoderOutputCache] = None,
+        prompt: Optional[List[int]] = None,
+    ):
+        batch_size = features.shape[0]
 
-        if max_length > self.model.max_length:
-            raise ValueError(
-                f"The length of the prompt is {len(prompt)}, and the `max_new_tokens` "
-                f"{max_length - len(prompt)}. Thus, the combined length of the prompt "
-                f"and `max_new_tokens` is: {max_length}. This exceeds the "
-                f"`max_length` of the Whisper model: {self.model.max_length}. "
-                "You should either reduce the length of your prompt, or "
-                "reduce the value of `max_new_tokens`, "
-                f"so that their combined length is less that {self.model.max_length}."
-            )
+        if prompt is None:
+            prompt = self.get_prompt(tokenizer, options)
 
-        encoder_output = self.model.encode(features)
+        if encoder_output is None:
+            encoder_output = self.model.encode(features, cache=encoder_cache)
         prompts = [prompt.copy() for _ in range(batch_size)]
 
         if options.multilingual:
@@ -219,36 +365,10 @@ class BatchedInferencePipeline:
             for i, language_token in enumerate(language_tokens):
                 prompts[i][language_token_index] = language_token
 
-        results = self.model.model.generate(
-            encoder_output,
-            prompts,
-            beam_size=options.beam_size,
-            patience=options.patience,
-            length_penalty=options.length_penalty,
-            max_length=max_length,
-            suppress_blank=options.suppress_blank,
-            suppress_tokens=options.suppress_tokens,
-            return_scores=True,
-            return_no_speech_prob=True,
-            sampling_temperature=options.temperatures[0],
-            repetition_penalty=options.repetition_penalty,
-            no_repeat_ngram_size=options.no_repeat_ngram_size,
+        output = self.model.generate_batch_with_fallback(
+            encoder_output, prompts, tokenizer, options, durations
         )
 
-        output = []
-        for result in results:
-            # return scores
-            seq_len = len(result.sequences_ids[0])
-            cum_logprob = result.scores[0] * (seq_len**options.length_penalty)
-
-            output.append(
-                dict(
-                    avg_logprob=cum_logprob / (seq_len + 1),
-                    no_speech_prob=result.no_speech_prob,
-                    tokens=result.sequences_ids[0],
-                )
-            )
-
         return encoder_output, output
 
     def transcribe(
@@ -296,6 +416,14 @@ class BatchedInferencePipeline:
         hotwords: Optional[str] = None,
         language_detection_threshold: Optional[float] = 0.5,
         language_detection_segments: int = 1,
+        chunk_lookahead: int = 0,
+        vad_cache: Optional[VadCache] = None,
+        bucket_batches: bool = False,
+        max_tokens_per_second: Optional[float] = None,
+        adaptive_beam: bool = False,
+        language_detection_batched: bool = False,
+        language_detection_spread: bool = False,
+        encoder_cache: Optional[EncoderOutputCache] = None,
     ) -> Tuple[Iterable[Segment], TranscriptionInfo]:
         """transcribe audio in chunks in batched fashion and return with language info.
 
@@ -313,14 +441,24 @@ class BatchedInferencePipeline:
             repetition_penalty: Penalty applied to the score of previously generated tokens
                 (set > 1 to penalize).
             no_repeat_ngram_size: Prevent repetitions of ngrams with this size (set 0 to disable).
-            temperature: Temperature for sampling. If a list or tuple is passed,
-                only the first value is used.
+            temperature: Temperature for sampling. It can be a tuple of temperatures,
+                which will be successively used for the batch items that fail the
+                `compression_ratio_threshold` or `log_prob_threshold` checks. Only the
+                failing items are decoded again, using their existing encoder output.
+            compression_ratio_threshold: If the gzip compression ratio is above this value,
+                treat as failed.
+            log_prob_threshold: If the average log probability over sampled tokens is
+                below this value, treat as failed.
+            no_speech_threshold: If the no_speech probability is higher than this value AND
+                the average log probability over sampled tokens is below `log_prob_threshold`,
+                consider the segment as silent.
             initial_prompt: Optional text string or iterable of token ids to provide as a
                 prompt for the each window.
             suppress_blank: Suppress blank outputs at the beginning of the sampling.
             suppress_tokens: List of token IDs to suppress. -1 will suppress a default set
                 of symbols as defined in `tokenizer.non_speech_tokens()`.
             without_timestamps: Only sample text tokens.
+            max_initial_timestamp: The initial timestamp cannot be later than this.
             word_timestamps: Extract word-level timestamps using the cross-attention pattern
                 and dynamic time warping, and include the timestamps for each word in each segment.
                 Set as False.
@@ -347,15 +485,34 @@ class BatchedInferencePipeline:
             language_detection_threshold: If the maximum probability of the language tokens is
                 higher than this value, the language is detected.
             language_detection_segments: Number of segments to consider for the language detection.
+            chunk_lookahead: Number of previous chunks that remain open when packing the speech
+                segments into chunks of `chunk_length`. With 0, the segments are packed greedily
+                in order. Higher values fill partially empty chunks with later segments, which
+                reduces the number of chunks to decode. Segments are still yielded in
+                chronological order.
+            vad_cache: Optional cache of speech timestamps (see `VadCache`), used to skip the
+                VAD model when the same audio is processed again with the same VAD parameters.
+            bucket_batches: Form the batches from chunks of similar speech duration instead
+                of consecutive chunks, so that short chunks do not wait for the decoding of
+                long ones. The segments are still yielded in the chunk order, once all the
+                previous chunks are decoded.
+            max_tokens_per_second: Optional token budget per second of speech. Each chunk
+                generates at most this many tokens per second of its duration, rounded up to
+                a power of two seconds, which stops hallucination loops in short chunks
+                early. The chunks with different budgets are decoded in separate calls.
+            adaptive_beam: Decode the chunks with greedy search first, and decode again with
+                beam search only the chunks whose greedy result fails the compression ratio or
+                log probability checks, or whose no_speech probability is above
+                `no_speech_threshold`.
+            language_detection_batched: Encode the `language_detection_segments` windows and
+                detect their language in a single batched call.
+            language_detection_spread: Sample the language detection windows evenly across
+                the speech instead of taking consecutive windows from the start.
+            encoder_cache: Optional cache of encoder outputs (see `EncoderOutputCache`), used
+                to skip the encoder when the same chunks are decoded again with other
+                decoding options.
 
         Unused Arguments
-            compression_ratio_threshold: If the gzip compression ratio is above this value,
-                treat as failed.
-            log_prob_threshold: If the average log probability over sampled tokens is
-                below this value, treat as failed.
-            no_speech_threshold: If the no_speech probability is higher than this value AND
-                the average log probability over sampled tokens is below `log_prob_threshold`,
-                consider the segment as silent.
             condition_on_previous_text: If True, the previous output of the model is provided
                 as a prompt for the next window; disabling may make the text inconsistent across
                 windows, but the model becomes less prone to getting stuck in a failure loop,
@@ -363,7 +520,6 @@ class BatchedInferencePipeline:
             prompt_reset_on_temperature: Resets prompt if temperature is above this value.
                 Arg has effect only if condition_on_previous_text is True. Set at 0.5
             prefix: Optional text to provide as a prefix at the beginning of each window.
-            max_initial_timestamp: The initial timestamp cannot be later than this, set at 0.0.
             hallucination_silence_threshold: Optional[float]
                 When word_timestamps is True, skip silent periods longer than this threshold
                 (in seconds) when a possible hallucination is detected. set as None.
@@ -408,7 +564,9 @@ class BatchedInferencePipeline:
                         **vad_parameters, max_speech_duration_s=chunk_length
                     )
 
-                clip_timestamps = get_speech_timestamps(audio, vad_parameters)
+                clip_timestamps = get_speech_timestamps(
+                    audio, vad_parameters, cache=vad_cache
+                )
             # run the audio if it is less than 30 sec even without clip_timestamps
             elif duration < chunk_length:
                 clip_timestamps = [{"start": 0, "end": audio.shape[0]}]
@@ -424,8 +582,14 @@ class BatchedInferencePipeline:
             ]
 
         audio_chunks, chunks_metadata = collect_chunks(
-            audio, clip_timestamps, max_duration=chunk_length
+            audio, clip_timestamps, max_duration=chunk_length, lookahead=chunk_lookahead
         )
+        # speech segments in the order they are concatenated in the chunks
+        speech_chunks = [
+            segment
+            for chunk_metadata in chunks_metadata
+            for segment in chunk_metadata["segments"]
+        ]
 
         duration_after_vad = (
             sum((segment["end"] - segment["start"]) for segment in clip_timestamps)
@@ -436,6 +600,11 @@ class BatchedInferencePipeline:
             "VAD filter removed %s of audio",
             format_timestamp(duration - duration_after_vad),
         )
+        self.model.logger.debug(
+            "Packed %d speech segments into %d chunks",
+            len(speech_chunks),
+            len(audio_chunks),
+        )
 
         features = (
             [self.model.feature_extractor(chunk)[..., :-1] for chunk in audio_chunks]
@@ -444,6 +613,7 @@ class BatchedInferencePipeline:
         )
 
         all_language_probs = None
+        first_encoder_output = None
         # detecting the language if not provided
         if language is None:
             if not self.model.model.is_multilingual:
@@ -454,18 +624,33 @@ class BatchedInferencePipeline:
                     language,
                     language_probability,
                     all_language_probs,
+                    encoder_outputs,
                 ) = self.model.detect_language(
-                    features=np.concatenate(
-                        features
-                        + [
-                            np.full((self.model.model.n_mels, 1), -1.5, dtype="float32")
-                        ],
-                        axis=1,
-                    ),  # add a dummy feature to account for empty audio
+                    features=(
+                        np.concatenate(features, axis=1)
+                        if features
+                        # a dummy feature to account for empty audio
+                        else np.full(
+                            (self.model.model.n_mels, 1), -1.5, dtype="float32"
+                        )
+                    ),
                     language_detection_segments=language_detection_segments,
                     language_detection_threshold=language_detection_threshold,
+                    return_encoder_outputs=True,
+                    language_detection_batched=language_detection_batched,
+                    language_detection_spread=language_detection_spread,
+                    encoder_cache=encoder_cache,
                 )
 
+                # the first detection window is the first chunk when it is the only
+                # chunk or when it is a full window
+                if features and (
+                    len(features) == 1
+                    or features[0].shape[-1]
+                    == self.model.feature_extractor.nb_max_frames
+                ):
+                    first_encoder_output = encoder_outputs[0]
+
                 self.model.logger.info(
                     "Detected language '%s' with probability %.2f",
                     language,
@@ -481,12 +666,7 @@ class BatchedInferencePipeline:
 
             language_probability = 1
 
-        tokenizer = Tokenizer(
-            self.model.hf_tokenizer,
-            self.model.model.is_multilingual,
-            task=task,
-            language=language,
-        )
+        tokenizer = self.model.get_tokenizer(task, language)
 
         features = (
             np.stack([pad_or_trim(feature) for feature in features]) if features else []
@@ -503,15 +683,13 @@ class BatchedInferencePipeline:
             no_speech_threshold=no_speech_threshold,
             compression_ratio_threshold=compression_ratio_threshold,
             temperatures=(
-                temperature[:1]
-                if isinstance(temperature, (list, tuple))
-                else [temperature]
+                temperature if isinstance(temperature, (list, tuple)) else [temperature]
             ),
             initial_prompt=initial_prompt,
             prefix=prefix,
             suppress_blank=suppress_blank,
             suppress_tokens=(
-                get_suppressed_tokens(tokenizer, suppress_tokens)
+                self.model.get_suppressed_tokens(tokenizer, suppress_tokens)
                 if suppress_tokens
                 else suppress_tokens
             ),
@@ -519,6 +697,13 @@ class BatchedInferencePipeline:
             append_punctuations=append_punctuations,
             max_new_tokens=max_new_tokens,
             hotwords=hotwords,
+            speculative_encode=False,
+            parallel_fallbacks=0,
+            max_tokens_per_second=max_tokens_per_second,
+            early_no_speech_threshold=None,
+            loop_probe_length=None,
+            adaptive_beam=adaptive_beam,
+            language_reuse_threshold=None,
             word_timestamps=word_timestamps,
             hallucination_silence_threshold=None,
             condition_on_previous_text=False,
@@ -526,7 +711,7 @@ class BatchedInferencePipeline:
             prompt_reset_on_temperature=0.5,
             multilingual=multilingual,
             without_timestamps=without_timestamps,
-            max_initial_timestamp=0.0,
+            max_initial_timestamp=max_initial_timestamp,
         )
 
         info = TranscriptionInfo(
@@ -546,25 +731,83 @@ class BatchedInferencePipeline:
             batch_size,
             options,
             log_progress,
+            bucket_batches,
+            first_encoder_output,
+            encoder_cache,
         )
-        segments = restore_speech_timestamps(segments, clip_timestamps, sampling_rate)
+        segments = restore_speech_timestamps(segments, speech_chunks, sampling_rate)
+        if chunk_lookahead > 0:
+            segments = sort_packed_segments(
+                segments,
+                chunks_metadata,
+                sampling_rate,
+                self.model.frames_per_second,
+            )
 
         return segments, info
 
     def _batched_segments_generator(
-        self, features, tokenizer, chunks_metadata, batch_size, options, log_progress
+        self,
+        features,
+        tokenizer,
+        chunks_metadata,
+        batch_size,
+        options,
+        log_progress,
+        bucket_batches=False,
+        first_encoder_output=None,
+        encoder_cache=None,
     ):
         pbar = tqdm(total=len(features), disable=not log_progress, position=0)
         seg_idx = 0
+        # the prompt is the same for all the chunks
+        prompt = self.get_prompt(tokenizer, options)
+
+        chunk_indices = list(range(len(features)))
+        if bucket_batches:
+            # batch the chunks with a similar speech duration together
+            chunk_indices.sort(key=lambda i: chunks_metadata[i]["duration"])
+        # results of the decoded chunks that are not yielded yet, by chunk index
+        pending_results = {}
+        next_chunk_index = 0
+
         for i in range(0, len(features), batch_size):
+            batch_indices = chunk_indices[i : i + batch_size]
+            batch_features = (
+                features[batch_indices]
+                if bucket_batches
+                else features[i : i + batch_size]
+            )
+            encoder_output = None
+            if first_encoder_output is not None and batch_indices[0] == 0:
+                # reuse the encoder output of the language detection
+                encoder_output = (
+                    concatenate_storages(
+                        [
+                            first_encoder_output,
+                            self.model.encode(batch_features[1:], cache=encoder_cache),
+                        ]
+                    )
+                    if len(batch_indices) > 1
+                    else first_encoder_output
+                )
+
             results = self.forward(
-                features[i : i + batch_size],
+                batch_features,
                 tokenizer,
-                chunks_metadata[i : i + batch_size],
+                [chunks_metadata[j] for j in batch_indices],
                 options,
+                encoder_output,
+                encoder_cache,
+                prompt,
             )
+            pending_results.update(zip(batch_indices, results))
+
+            # yield the segments in the chunk order
+            while next_chunk_index in pending_results:
+                result = pending_results.pop(next_chunk_index)
+                next_chunk_index += 1
 
-            for result in results:
                 for segment in result:
                     seg_idx += 1
                     yield Segment(
@@ -582,7 +825,7 @@ class BatchedInferencePipeline:
                         avg_logprob=segment["avg_logprob"],
                         no_speech_prob=segment["no_speech_prob"],
                         compression_ratio=segment["compression_ratio"],
-                        temperature=options.temperatures[0],
+                        temperature=segment["temperature"],
                     )
 
                 pbar.update(1)
@@ -659,6 +902,7 @@ class WhisperModel:
                 revision=revision,
                 use_auth_token=use_auth_token,
             )
+        self.model_path = model_path
 
         self.model = ctranslate2.models.Whisper(
             model_path,
@@ -695,11 +939,50 @@ class WhisperModel:
         self.time_precision = 0.02
         self.max_length = 448
 
+        # tokenizers by (task, language) and suppressed tokens by requested tokens
+        self.tokenizers = {}
+        self.suppressed_tokens = {}
+        self.tokenizers_lock = threading.Lock()
+
     @property
     def supported_languages(self) -> List[str]:
         """The languages supported by the model."""
         return list(_LANGUAGE_CODES) if self.model.is_multilingual else ["en"]
 
+    def get_tokenizer(self, task: str, language: str) -> Tokenizer:
+        """Returns the tokenizer for a task and language, shared by the transcriptions.
+
+        The tokenizer caches the special token IDs and the non-speech tokens, so it should
+        be copied before changing its language.
+        """
+        key = (task, language)
+        with self.tokenizers_lock:
+            tokenizer = self.tokenizers.get(key)
+            if tokenizer is None:
+                tokenizer = Tokenizer(
+                    self.hf_tokenizer,
+                    self.model.is_multilingual,
+                    task=task,
+                    language=language,
+                )
+                self.tokenizers[key] = tokenizer
+        return tokenizer
+
+    def get_suppressed_tokens(
+        self, tokenizer: Tokenizer, suppress_tokens: List[int]
+    ) -> Tuple[int]:
+        """Returns the tokens to suppress, computed once per list of requested tokens.
+
+        The result only depends on the vocabulary, which is the same for all the tokenizers
+        of the model.
+        """
+        key = tuple(suppress_tokens)
+        suppressed_tokens = self.suppressed_tokens.get(key)
+        if suppressed_tokens is None:
+            suppressed_tokens = get_suppressed_tokens(tokenizer, suppress_tokens)
+            self.suppressed_tokens[key] = suppressed_tokens
+        return suppressed_tokens
+
     def _get_feature_kwargs(self, model_path, preprocessor_bytes=None) -> dict:
         config = {}
         try:
@@ -762,6 +1045,18 @@ class WhisperModel:
         hotwords: Optional[str] = None,
         language_detection_threshold: Optional[float] = 0.5,
         language_detection_segments: int = 1,
+        vad_cache: Optional[VadCache] = None,
+        speculative_encode: bool = False,
+        parallel_fallbacks: int = 0,
+        max_tokens_per_second: Optional[float] = None,
+        early_no_speech_threshold: Optional[float] = None,
+        loop_probe_length: Optional[int] = None,
+        adaptive_beam: bool = False,
+        window_batch_size: int = 1,
+        language_detection_batched: bool = False,
+        language_detection_spread: bool = False,
+        language_reuse_threshold: Optional[float] = None,
+        encoder_cache: Optional[EncoderOutputCache] = None,
     ) -> Tuple[Iterable[Segment], TranscriptionInfo]:
         """Transcribes an input file.
 
@@ -831,6 +1126,54 @@ class WhisperModel:
           language_detection_threshold: If the maximum probability of the language tokens is higher
            than this value, the language is detected.
           language_detection_segments: Number of segments to consider for the language detection.
+          vad_cache: Optional cache of speech timestamps (see `VadCache`), used to skip the
+            VAD model when the same audio is processed again with the same VAD parameters.
+          speculative_encode: Encode the window following the current one in a background
+            thread while the current window is decoded. The result is reused when the decoding
+            moves to that window, which is the case when it ends with a single timestamp or
+            when the window is skipped as silent. This requires num_workers > 1 so that the
+            model can run the encoding and the decoding in parallel.
+          parallel_fallbacks: Number of fallback temperatures decoded in parallel with the
+            current one. The results are still checked in temperature order with the same
+            selection rules, but a failed attempt no longer waits for the next decoding to
+            start. Discarded decodings still run to completion, so this should be at most
+            num_workers - 1.
+          max_tokens_per_second: Optional token budget per second of audio. Each window
+            generates at most this many tokens per second of its duration (in addition to
+            `max_new_tokens`), which stops hallucination loops in short windows early.
+          early_no_speech_threshold: If the no_speech probability is higher than this value
+            after a single decoding step, consider the window as silent and skip it without
+            decoding it. The average log probability is not available yet to override the
+            decision, so this should be higher than `no_speech_threshold`.
+          loop_probe_length: If set, each decoding attempt first generates this number of
+            tokens. When they contain a repetition loop, the attempt is treated as failed
+            and the next temperature is used without generating the remaining tokens.
+            Otherwise the attempt is decoded again in full, so the probe costs this number
+            of decoding steps. It is not used with `parallel_fallbacks`.
+          adaptive_beam: Decode each window with greedy search first, and use beam search
+            with `beam_size` only when the greedy result fails the compression ratio or log
+            probability checks, or when its no_speech probability is above
+            `no_speech_threshold`. It is not used with `parallel_fallbacks`.
+          window_batch_size: When condition_on_previous_text and word_timestamps are False,
+            decode this number of 30-second windows per batch. The windows are placed at a
+            fixed stride and the unfinished tail of a window that does not end with a single
+            timestamp is decoded again in a later batch, which keeps the timestamps of the
+            sequential transcription without VAD chunking. `speculative_encode`,
+            `parallel_fallbacks`, `early_no_speech_threshold` and `loop_probe_length` are not
+            used in this mode.
+          language_detection_batched: Encode the `language_detection_segments` windows and
+            detect their language in a single batched call.
+          language_detection_spread: Sample the language detection windows evenly across the
+            audio instead of taking consecutive windows from the start.
+          language_reuse_threshold: With `multilingual`, keep the language of the previous
+            window instead of detecting it again when it was detected with a probability
+            higher than this value and the previous window was decoded at the first
+            temperature with an average log probability above `log_prob_threshold`. It is
+            not used with `window_batch_size`.
+          encoder_cache: Optional cache of encoder outputs (see `EncoderOutputCache`), used to
+            skip the encoder when the same windows are decoded again with other decoding
+            options. The windows depend on the decoding when they start at the last
+            timestamp of the previous window, so only the identical windows are reused.
         Returns:
           A tuple with:
 
@@ -861,9 +1204,12 @@ class WhisperModel:
                 vad_parameters = VadOptions()
             elif isinstance(vad_parameters, dict):
                 vad_parameters = VadOptions(**vad_parameters)
-            speech_chunks = get_speech_timestamps(audio, vad_parameters)
+            speech_chunks = get_speech_timestamps(
+                audio, vad_parameters, cache=vad_cache
+            )
             audio_chunks, chunks_metadata = collect_chunks(audio, speech_chunks)
-            audio = np.concatenate(audio_chunks, axis=0)
+            # without max_duration, all the speech is gathered in a single chunk
+            audio = audio_chunks[0]
             duration_after_vad = audio.shape[0] / sampling_rate
 
             self.logger.info(
@@ -898,11 +1244,12 @@ class WhisperModel:
                 language = "en"
                 language_probability = 1
             else:
-                start_timestamp = (
-                    float(clip_timestamps.split(",")[0])
+                clip_points = (
+                    [float(ts) for ts in clip_timestamps.split(",")]
                     if isinstance(clip_timestamps, str)
-                    else clip_timestamps[0]
+                    else clip_timestamps
                 )
+                start_timestamp = clip_points[0]
                 content_frames = features.shape[-1] - 1
                 seek = (
                     int(start_timestamp * self.frames_per_second)
@@ -913,11 +1260,34 @@ class WhisperModel:
                     language,
                     language_probability,
                     all_language_probs,
+                    encoder_outputs,
                 ) = self.detect_language(
-                    features=features[..., seek:],
+                    # keep the last frame when there is no content to detect on a padding window
+                    features=features[..., seek : max(content_frames, seek + 1)],
                     language_detection_segments=language_detection_segments,
                     language_detection_threshold=language_detection_threshold,
+                    return_encoder_outputs=True,
+                    language_detection_batched=language_detection_batched,
+                    language_detection_spread=language_detection_spread,
+                    encoder_cache=encoder_cache,
+                )
+
+                # reuse the first encoder output if it matches the first window to decode
+                seek_clip_end = (
+                    round(clip_points[1] * self.frames_per_second)
+                    if len(clip_points) > 1
+                    else content_frames
+                )
+                segment_size = min(
+                    self.feature_extractor.nb_max_frames,
+                    content_frames - seek,
+                    seek_clip_end - seek,
                 )
+                if seek == round(start_timestamp * self.frames_per_second) and (
+                    segment_size
+                    == min(self.feature_extractor.nb_max_frames, content_frames - seek)
+                ):
+                    encoder_output = encoder_outputs[0]
 
                 self.logger.info(
                     "Detected language '%s' with probability %.2f",
@@ -934,12 +1304,10 @@ class WhisperModel:
 
             language_probability = 1
 
-        tokenizer = Tokenizer(
-            self.hf_tokenizer,
-            self.model.is_multilingual,
-            task=task,
-            language=language,
-        )
+        tokenizer = self.get_tokenizer(task, language)
+        if multilingual:
+            # the language of the tokenizer changes with the detected language
+            tokenizer = copy.copy(tokenizer)
 
         options = TranscriptionOptions(
             beam_size=beam_size,
@@ -960,7 +1328,7 @@ class WhisperModel:
             prefix=prefix,
             suppress_blank=suppress_blank,
             suppress_tokens=(
-                get_suppressed_tokens(tokenizer, suppress_tokens)
+                self.get_suppressed_tokens(tokenizer, suppress_tokens)
                 if suppress_tokens
                 else suppress_tokens
             ),
@@ -974,11 +1342,40 @@ class WhisperModel:
             clip_timestamps=clip_timestamps,
             hallucination_silence_threshold=hallucination_silence_threshold,
             hotwords=hotwords,
+            speculative_encode=speculative_encode,
+            parallel_fallbacks=parallel_fallbacks,
+            max_tokens_per_second=max_tokens_per_second,
+            early_no_speech_threshold=early_no_speech_threshold,
+            loop_probe_length=loop_probe_length,
+            adaptive_beam=adaptive_beam,
+            language_reuse_threshold=language_reuse_threshold,
         )
 
-        segments = self.generate_segments(
-            features, tokenizer, options, log_progress, encoder_output
-        )
+        if window_batch_size > 1 and (condition_on_previous_text or word_timestamps):
+            self.logger.warning(
+                "window_batch_size is only used when condition_on_previous_text and "
+                "word_timestamps are False; decoding the windows one by one instead."
+            )
+            window_batch_size = 1
+
+        if window_batch_size > 1:
+            segments = self.generate_window_batches(
+                features,
+                tokenizer,
+                options,
+                log_progress,
+                window_batch_size,
+                encoder_cache,
+            )
+        else:
+            segments = self.generate_segments(
+                features,
+                tokenizer,
+                options,
+                log_progress,
+                encoder_output,
+                encoder_cache,
+            )
 
         if speech_chunks:
             segments = restore_speech_timestamps(segments, speech_chunks, sampling_rate)
@@ -995,6 +1392,55 @@ class WhisperModel:
 
         return segments, info
 
+    def transcribe_multiple(
+        self,
+        audio: Union[str, BinaryIO, np.ndarray],
+        options: List[dict],
+        max_shared_windows: int = 8,
+        **kwargs,
+    ) -> List[Tuple[Iterable[Segment], TranscriptionInfo]]:
+        """Transcribes an input file with several sets of options sharing the encoder.
+
+        Each set of options is a dictionary of `transcribe` arguments, for example
+        `[{"task": "transcribe"}, {"task": "translate"}]` to get the transcription and the
+        translation in one pass. The windows with the same features are encoded once and
+        their encoder output is used by all the transcriptions, which is always the case
+        for the first window and then whenever the transcriptions move to the same window.
+
+        The encoder outputs are kept until all the transcriptions used them, or until
+        `max_shared_windows` newer windows were encoded, so the segments should be
+        consumed in lockstep, for example with `zip` or from one thread per transcription.
+
+        Arguments:
+          audio: Path to the input file (or a file-like object), or the audio waveform.
+          options: List of dictionaries of `transcribe` arguments, one per transcription.
+          max_shared_windows: Maximum number of encoder outputs kept for the transcriptions
+            that did not use them yet.
+          kwargs: `transcribe` arguments common to all the transcriptions.
+
+        Returns:
+          A list with a tuple of segments and transcription information for each set of
+          options (see `transcribe`).
+        """
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(
+                audio, sampling_rate=self.feature_extractor.sampling_rate
+            )
+
+        shared_encoder_outputs = SharedEncoderOutputs(
+            self, len(options), max_shared_windows
+        )
+        results = []
+        for index, stream_options in enumerate(options):
+            stream_model = copy.copy(self)
+            stream_model.encode = functools.partial(
+                shared_encoder_outputs.encode, index
+            )
+            results.append(
+                stream_model.transcribe(audio, **{**kwargs, **stream_options})
+            )
+        return results
+
     def _split_segments_by_timestamps(
         self,
         tokenizer: Tokenizer,
@@ -1081,6 +1527,7 @@ class WhisperModel:
         options: TranscriptionOptions,
         log_progress,
         encoder_output: Optional[ctranslate2.StorageView] = None,
+        encoder_cache: Optional[EncoderOutputCache] = None,
     ) -> Iterable[Segment]:
         content_frames = features.shape[-1] - 1
         content_duration = float(content_frames * self.feature_extractor.time_per_frame)
@@ -1124,6 +1571,26 @@ class WhisperModel:
 
         pbar = tqdm(total=content_duration, unit="seconds", disable=not log_progress)
         last_speech_timestamp = 0.0
+
+        # speculative encoding of the next window: ((seek, segment_size), future)
+        prefetch_executor = (
+            ThreadPoolExecutor(max_workers=1) if options.speculative_encode else None
+        )
+        prefetched = None
+        num_prefetched = 0
+        num_prefetch_hits = 0
+        adaptive_beam_stats = {"greedy": 0, "escalated": 0}
+        prompt_builder = PromptBuilder(
+            tokenizer,
+            self.max_length,
+            options.without_timestamps,
+            options.prefix,
+            options.hotwords,
+        )
+        reuse_language = False
+        num_language_windows = 0
+        num_language_detections = 0
+
         # NOTE: This loop is obscurely flattened to make the diff readable.
         # A later commit should turn this into a simpler nested loop.
         # for seek_clip_start, seek_clip_end in seek_clips:
@@ -1160,31 +1627,83 @@ class WhisperModel:
 
             previous_tokens = all_tokens[prompt_reset_since:]
 
-            if seek > 0 or encoder_output is None:
-                encoder_output = self.encode(segment)
+            if encoder_output is None or seek != seek_clips[0][0]:
+                if prefetched is not None and prefetched[0] == (seek, segment_size):
+                    encoder_output = prefetched[1].result()
+                    num_prefetch_hits += 1
+                else:
+                    encoder_output = self.encode(segment, cache=encoder_cache)
+
+            if prefetch_executor is not None:
+                if prefetched is not None:
+                    prefetched[1].cancel()
+                    prefetched = None
+
+                next_seek = seek + segment_size
+                next_segment_size = min(
+                    self.feature_extractor.nb_max_frames,
+                    content_frames - next_seek,
+                    seek_clip_end - next_seek,
+                )
+                if next_segment_size > 0:
+                    next_segment = pad_or_trim(
+                        features[:, next_seek : next_seek + next_segment_size]
+                    )
+                    prefetched = (
+                        (next_seek, next_segment_size),
+                        prefetch_executor.submit(
+                            self.encode, next_segment, encoder_cache
+                        ),
+                    )
+                    num_prefetched += 1
 
             if options.multilingual:
-                results = self.model.detect_language(encoder_output)
-                language_token, language_probability = results[0][0]
-                language = language_token[2:-2]
+                num_language_windows += 1
+                if not reuse_language:
+                    results = self.model.detect_language(encoder_output)
+                    language_token, language_probability = results[0][0]
+                    language = language_token[2:-2]
+                    num_language_detections += 1
+
+                    tokenizer.language = tokenizer.tokenizer.token_to_id(language_token)
+                    tokenizer.language_code = language
+                reuse_language = False
+
+            prompt = prompt_builder.get_prompt(previous_tokens, use_prefix=seek == 0)
+
+            if options.early_no_speech_threshold is not None:
+                # the no_speech probability is computed at the first decoding step
+                no_speech_prob = self.model.generate(
+                    encoder_output,
+                    [prompt],
+                    max_length=len(prompt) + 1,
+                    return_no_speech_prob=True,
+                )[0].no_speech_prob
 
-                tokenizer.language = tokenizer.tokenizer.token_to_id(language_token)
-                tokenizer.language_code = language
+                if no_speech_prob > options.early_no_speech_threshold:
+                    self.logger.debug(
+                        "Early no speech threshold is met (%f > %f)",
+                        no_speech_prob,
+                        options.early_no_speech_threshold,
+                    )
 
-            prompt = self.get_prompt(
-                tokenizer,
-                previous_tokens,
-                without_timestamps=options.without_timestamps,
-                prefix=options.prefix if seek == 0 else None,
-                hotwords=options.hotwords,
-            )
+                    # fast-forward to the next segment boundary
+                    seek += segment_size
+                    continue
 
             (
                 result,
                 avg_logprob,
                 temperature,
                 compression_ratio,
-            ) = self.generate_with_fallback(encoder_output, prompt, tokenizer, options)
+            ) = self.generate_with_fallback(
+                encoder_output,
+                prompt,
+                tokenizer,
+                options,
+                segment_duration,
+                adaptive_beam_stats,
+            )
 
             if options.no_speech_threshold is not None:
                 # no voice activity check
@@ -1208,6 +1727,18 @@ class WhisperModel:
                     seek += segment_size
                     continue
 
+            # the language of a confident window with speech is kept for the next one
+            reuse_language = (
+                options.multilingual
+                and options.language_reuse_threshold is not None
+                and language_probability > options.language_reuse_threshold
+                and temperature == options.temperatures[0]
+                and (
+                    options.log_prob_threshold is None
+                    or avg_logprob > options.log_prob_threshold
+                )
+            )
+
             tokens = result.sequences_ids[0]
 
             previous_seek = seek
@@ -1362,75 +1893,514 @@ class WhisperModel:
             )
         pbar.close()
 
-    def encode(self, features: np.ndarray) -> ctranslate2.StorageView:
-        # When the model is running on multiple GPUs, the encoder output should be moved
-        # to the CPU since we don't know which GPU will handle the next job.
-        to_cpu = self.model.device == "cuda" and len(self.model.device_index) > 1
-
-        if features.ndim == 2:
-            features = np.expand_dims(features, 0)
-        features = get_ctranslate2_storage(features)
-
-        return self.model.encode(features, to_cpu=to_cpu)
+        if prefetch_executor is not None:
+            prefetch_executor.shutdown(wait=False, cancel_futures=True)
+            self.logger.debug(
+                "Speculative encoding reused %d of %d prefetched windows",
+                num_prefetch_hits,
+                num_prefetched,
+            )
+        if adaptive_beam_stats["greedy"] > 0:
+            self.logger.debug(
+                "Escalated %d of %d greedy decodings to beam search",
+                adaptive_beam_stats["escalated"],
+                adaptive_beam_stats["greedy"],
+            )
+        if num_language_windows > 0:
+            self.logger.debug(
+                "Detected the language of %d of %d windows",
+                num_language_detections,
+                num_language_windows,
+            )
 
-    def generate_with_fallback(
+    def generate_window_batches(
         self,
-        encoder_output: ctranslate2.StorageView,
-        prompt: List[int],
+        features: np.ndarray,
         tokenizer: Tokenizer,
         options: TranscriptionOptions,
-    ) -> Tuple[ctranslate2.models.WhisperGenerationResult, float, float, float]:
-        decode_result = None
-        all_results = []
-        below_cr_threshold_results = []
+        log_progress,
+        batch_size: int,
+        encoder_cache: Optional[EncoderOutputCache] = None,
+    ) -> Iterable[Segment]:
+        """Decodes fixed-stride windows in batches.
+
+        Without conditioning on the previous text and without word timestamps, the
+        windows only depend on each other through the seek position. The windows are
+        placed every 30 seconds and decoded in batches, and when a window does not end
+        with a single timestamp, its unfinished tail after the last timestamp is decoded
+        again as a shorter window in a later batch. The segments of a window are clipped
+        to its end, and tails shorter than half a second are not decoded again, so the
+        windows after them start a few frames later than in the sequential mode. The
+        segments are yielded in order.
+        """
+        content_frames = features.shape[-1] - 1
+        content_duration = float(content_frames * self.feature_extractor.time_per_frame)
+        nb_max_frames = self.feature_extractor.nb_max_frames
 
-        max_initial_timestamp_index = int(
-            round(options.max_initial_timestamp / self.time_precision)
-        )
-        if options.max_new_tokens is not None:
-            max_length = len(prompt) + options.max_new_tokens
-        else:
-            max_length = self.max_length
+        if isinstance(options.clip_timestamps, str):
+            options.clip_timestamps = [
+                float(ts)
+                for ts in (
+                    options.clip_timestamps.split(",")
+                    if options.clip_timestamps
+                    else []
+                )
+            ]
 
-        if max_length > self.max_length:
-            raise ValueError(
-                f"The length of the prompt is {len(prompt)}, and the `max_new_tokens` "
-                f"{max_length - len(prompt)}. Thus, the combined length of the prompt "
-                f"and `max_new_tokens` is: {max_length}. This exceeds the "
-                f"`max_length` of the Whisper model: {self.max_length}. "
-                "You should either reduce the length of your prompt, or "
-                "reduce the value of `max_new_tokens`, "
-                f"so that their combined length is less that {self.max_length}."
-            )
+        seek_points: List[int] = [
+            round(ts * self.frames_per_second) for ts in options.clip_timestamps
+        ]
+        if len(seek_points) == 0:
+            seek_points.append(0)
+        if len(seek_points) % 2 == 1:
+            seek_points.append(content_frames)
 
-        for temperature in options.temperatures:
-            if temperature > 0:
-                kwargs = {
-                    "beam_size": 1,
-                    "num_hypotheses": options.best_of,
-                    "sampling_topk": 0,
-                    "sampling_temperature": temperature,
-                }
+        # regions to decode as (start, end) frames, in a heap ordered by start
+        regions = []
+        clip_ends = set()
+        for seek_clip_start, seek_clip_end in zip(seek_points[::2], seek_points[1::2]):
+            seek_clip_end = min(seek_clip_end, content_frames)
+            clip_ends.add(seek_clip_end)
+            for start in range(seek_clip_start, seek_clip_end, nb_max_frames):
+                regions.append((start, min(start + nb_max_frames, seek_clip_end)))
+        heapq.heapify(regions)
+        min_tail_frames = self.frames_per_second // 2
+        first_seek = regions[0][0] if regions else 0
+
+        initial_prompt_tokens = []
+        if options.initial_prompt is not None:
+            if isinstance(options.initial_prompt, str):
+                initial_prompt = " " + options.initial_prompt.strip()
+                initial_prompt_tokens = tokenizer.encode(initial_prompt)
             else:
-                kwargs = {
-                    "beam_size": options.beam_size,
-                    "patience": options.patience,
-                }
-
-            result = self.model.generate(
-                encoder_output,
-                [prompt],
-                length_penalty=options.length_penalty,
-                repetition_penalty=options.repetition_penalty,
-                no_repeat_ngram_size=options.no_repeat_ngram_size,
-                max_length=max_length,
-                return_scores=True,
-                return_no_speech_prob=True,
-                suppress_blank=options.suppress_blank,
-                suppress_tokens=options.suppress_tokens,
-                max_initial_timestamp_index=max_initial_timestamp_index,
-                **kwargs,
-            )[0]
+                initial_prompt_tokens = list(options.initial_prompt)
+        prompt_builder = PromptBuilder(
+            tokenizer,
+            self.max_length,
+            options.without_timestamps,
+            options.prefix,
+            options.hotwords,
+        )
+
+        pbar = tqdm(total=content_duration, unit="seconds", disable=not log_progress)
+        # decoded segments that are not yielded yet: (region start, index, segment)
+        decoded_segments = []
+        idx = 0
+        num_windows = len(regions)
+        num_tails = 0
+
+        while regions:
+            batch = [
+                heapq.heappop(regions) for _ in range(min(batch_size, len(regions)))
+            ]
+            segment_sizes = [end - start for start, end in batch]
+
+            encoder_output = self.encode(
+                np.stack([pad_or_trim(features[:, start:end]) for start, end in batch]),
+                cache=encoder_cache,
+            )
+            # as in the sequential transcription, the initial prompt and the prefix are
+            # only used for the first window
+            prompts = [
+                prompt_builder.get_prompt(
+                    initial_prompt_tokens if start == first_seek else [],
+                    use_prefix=start == 0,
+                )
+                for start, _ in batch
+            ]
+
+            if options.multilingual:
+                for prompt, segment_langs in zip(
+                    prompts, self.model.detect_language(encoder_output)
+                ):
+                    # the initial prompt shifts the language token of the first window
+                    language_token_index = prompt.index(tokenizer.sot) + 1
+                    prompt[language_token_index] = tokenizer.tokenizer.token_to_id(
+                        segment_langs[0][0]
+                    )
+
+            outputs = self.generate_batch_with_fallback(
+                encoder_output,
+                prompts,
+                tokenizer,
+                options,
+                [
+                    segment_size * self.feature_extractor.time_per_frame
+                    for segment_size in segment_sizes
+                ],
+            )
+
+            for (start, end), segment_size, output in zip(
+                batch, segment_sizes, outputs
+            ):
+                time_offset = start * self.feature_extractor.time_per_frame
+
+                if (
+                    options.no_speech_threshold is not None
+                    and output["no_speech_prob"] > options.no_speech_threshold
+                    and not (
+                        options.log_prob_threshold is not None
+                        and output["avg_logprob"] > options.log_prob_threshold
+                    )
+                ):
+                    self.logger.debug(
+                        "No speech threshold is met (%f > %f)",
+                        output["no_speech_prob"],
+                        options.no_speech_threshold,
+                    )
+                    pbar.update(segment_size * self.feature_extractor.time_per_frame)
+                    continue
+
+                current_segments, seek, _ = self._split_segments_by_timestamps(
+                    tokenizer=tokenizer,
+                    tokens=output["tokens"],
+                    time_offset=time_offset,
+                    segment_size=segment_size,
+                    segment_duration=segment_size
+                    * self.feature_extractor.time_per_frame,
+                    seek=start,
+                )
+
+                if start < seek and end - seek >= min_tail_frames:
+                    # decode the unfinished tail again, starting at the last timestamp
+                    heapq.heappush(regions, (seek, end))
+                    num_tails += 1
+
+                if end not in clip_ends:
+                    # the next region is decoded separately, so the segments of this
+                    # region cannot go past its end
+                    end_time = end * self.feature_extractor.time_per_frame
+                    current_segments = [
+                        {**segment, "end": min(segment["end"], end_time)}
+                        for segment in current_segments
+                        if segment["start"] < end_time
+                    ]
+                pbar.update(
+                    (min(max(seek, start), end) - start)
+                    * self.feature_extractor.time_per_frame
+                )
+
+                for segment in current_segments:
+                    decoded_segments.append(
+                        (
+                            start,
+                            len(decoded_segments),
+                            Segment(
+                                id=0,
+                                seek=start,
+                                start=segment["start"],
+                                end=segment["end"],
+                                text=tokenizer.decode(segment["tokens"]),
+                                tokens=segment["tokens"],
+                                temperature=output["temperature"],
+                                avg_logprob=output["avg_logprob"],
+                                compression_ratio=output["compression_ratio"],
+                                no_speech_prob=output["no_speech_prob"],
+                                words=None,
+                            ),
+                        )
+                    )
+
+            # the segments before the first pending region are final
+            decoded_segments.sort()
+            next_start = regions[0][0] if regions else float("inf")
+            while decoded_segments and decoded_segments[0][0] < next_start:
+                _, _, segment = decoded_segments.pop(0)
+                if segment.start == segment.end or not segment.text.strip():
+                    continue
+                idx += 1
+                yield replace(segment, id=idx)
+
+        pbar.close()
+        self.logger.debug(
+            "Decoded %d windows and %d unfinished tails", num_windows, num_tails
+        )
+
+    def encode(
+        self, features: np.ndarray, cache: Optional[EncoderOutputCache] = None
+    ) -> ctranslate2.StorageView:
+        # When the model is running on multiple GPUs, the encoder output should be moved
+        # to the CPU since we don't know which GPU will handle the next job.
+        to_cpu = self.model.device == "cuda" and len(self.model.device_index) > 1
+
+        if features.ndim == 2:
+            features = np.expand_dims(features, 0)
+        if cache is None:
+            return self.model.encode(get_ctranslate2_storage(features), to_cpu=to_cpu)
+
+        keys = [cache.get_key(self, window) for window in features]
+        arrays = [cache.get(key) for key in keys]
+        missing = [index for index, array in enumerate(arrays) if array is None]
+        if missing:
+            encoder_output = self.model.encode(
+                get_ctranslate2_storage(features[missing]), to_cpu=to_cpu
+            )
+            for index, array in zip(missing, get_storage_array(encoder_output)):
+                cache.put(keys[index], array)
+                arrays[index] = array
+            if len(missing) == len(arrays):
+                return encoder_output
+
+        self.logger.debug(
+            "Loaded %d of %d encoder outputs from the cache",
+            len(arrays) - len(missing),
+            len(arrays),
+        )
+        return get_ctranslate2_storage(np.stack(arrays))
+
+    def generate_batch_with_fallback(
+        self,
+        encoder_output: ctranslate2.StorageView,
+        prompts: List[List[int]],
+        tokenizer: Tokenizer,
+        options: TranscriptionOptions,
+        durations: Optional[List[float]] = None,
+    ) -> List[dict]:
+        """Decodes a batch with temperature fallback.
+
+        After each decoding, only the items that fail the compression ratio or log
+        probability checks are decoded again with the next temperature.
+        """
+        batch_size = len(prompts)
+
+        if durations is not None and options.max_tokens_per_second is not None:
+            # round the durations up to a power of two (at least 1 second) to limit
+            # the number of generate calls with different token budgets
+            durations = [
+                2 ** max(ceil(np.log2(duration)), 0) if duration > 0 else 1
+                for duration in durations
+            ]
+        else:
+            durations = [None] * batch_size
+        max_lengths = [
+            self.get_max_length(len(prompt), options, duration)
+            for prompt, duration in zip(prompts, durations)
+        ]
+
+        max_initial_timestamp_index = int(
+            round(options.max_initial_timestamp / self.time_precision)
+        )
+
+        output = [None] * batch_size
+        # decoding results of each item that did not pass the compression ratio check
+        # and of all its attempts, used to select a result when all attempts failed
+        below_cr_threshold_results = [[] for _ in range(batch_size)]
+        all_results = [[] for _ in range(batch_size)]
+        indices = list(range(batch_size))
+
+        def decode(indices, temperature, options):
+            # items with different token budgets or prompt layouts are decoded in
+            # separate calls
+            groups = {}
+            for index in indices:
+                prompt = prompts[index]
+                key = (max_lengths[index], prompt.index(tokenizer.sot), len(prompt))
+                groups.setdefault(key, []).append(index)
+
+            results = {}
+            for (max_length, _, _), group in groups.items():
+                group_results = self.generate_with_temperature(
+                    (
+                        encoder_output
+                        if len(group) == batch_size
+                        else select_encoder_output(encoder_output, group)
+                    ),
+                    [prompts[index] for index in group],
+                    options,
+                    temperature,
+                    max_length,
+                    max_initial_timestamp_index,
+                )
+                results.update(zip(group, group_results))
+            return results
+
+        for i, temperature in enumerate(options.temperatures):
+            if i > 0:
+                self.logger.debug(
+                    "Decoding %d of %d items again with temperature %.1f",
+                    len(indices),
+                    batch_size,
+                    temperature,
+                )
+
+            if temperature == 0 and options.adaptive_beam and options.beam_size > 1:
+                results = decode(indices, temperature, replace(options, beam_size=1))
+                escalated_indices = [
+                    index
+                    for index in indices
+                    if self.needs_beam_search(results[index], tokenizer, options)
+                ]
+                self.logger.debug(
+                    "Escalated %d of %d greedy decodings to beam search",
+                    len(escalated_indices),
+                    len(indices),
+                )
+                if escalated_indices:
+                    results.update(decode(escalated_indices, temperature, options))
+            else:
+                results = decode(indices, temperature, options)
+
+            failed_indices = []
+            for index in indices:
+                result = results[index]
+                tokens = result.sequences_ids[0]
+
+                # return scores
+                seq_len = len(tokens)
+                cum_logprob = result.scores[0] * (seq_len**options.length_penalty)
+                avg_logprob = cum_logprob / (seq_len + 1)
+                compression_ratio = get_compression_ratio(
+                    tokenizer.decode(tokens).strip()
+                )
+
+                decode_result = dict(
+                    avg_logprob=avg_logprob,
+                    no_speech_prob=result.no_speech_prob,
+                    tokens=tokens,
+                    temperature=temperature,
+                    compression_ratio=compression_ratio,
+                )
+                all_results[index].append(decode_result)
+
+                needs_fallback = False
+                if options.compression_ratio_threshold is not None:
+                    if compression_ratio > options.compression_ratio_threshold:
+                        needs_fallback = True  # too repetitive
+                    else:
+                        below_cr_threshold_results[index].append(decode_result)
+
+                if (
+                    options.log_prob_threshold is not None
+                    and avg_logprob < options.log_prob_threshold
+                ):
+                    needs_fallback = True  # average log probability is too low
+
+                    if (
+                        options.no_speech_threshold is not None
+                        and result.no_speech_prob > options.no_speech_threshold
+                    ):
+                        needs_fallback = False  # silence
+
+                if needs_fallback and i + 1 < len(options.temperatures):
+                    failed_indices.append(index)
+                elif needs_fallback:
+                    # all failed, select the result with the highest average log probability
+                    decode_result = max(
+                        below_cr_threshold_results[index] or all_results[index],
+                        key=lambda x: x["avg_logprob"],
+                    )
+                    # to report the final temperature like the sequential transcription
+                    output[index] = dict(decode_result, temperature=temperature)
+                else:
+                    output[index] = decode_result
+
+            if not failed_indices:
+                break
+            indices = failed_indices
+
+        return output
+
+    def generate_with_fallback(
+        self,
+        encoder_output: ctranslate2.StorageView,
+        prompt: List[int],
+        tokenizer: Tokenizer,
+        options: TranscriptionOptions,
+        segment_duration: Optional[float] = None,
+        adaptive_beam_stats: Optional[dict] = None,
+    ) -> Tuple[ctranslate2.models.WhisperGenerationResult, float, float, float]:
+        decode_result = None
+        all_results = []
+        below_cr_threshold_results = []
+
+        max_initial_timestamp_index = int(
+            round(options.max_initial_timestamp / self.time_precision)
+        )
+        max_length = self.get_max_length(len(prompt), options, segment_duration)
+
+        # asynchronous generations of the next temperatures when running in parallel
+        pending = []
+        probe_result = None
+
+        for i, temperature in enumerate(options.temperatures):
+            if options.parallel_fallbacks > 0:
+                num_parallel = min(
+                    options.parallel_fallbacks + 1, len(options.temperatures) - i
+                )
+                while len(pending) < num_parallel:
+                    pending.append(
+                        self.generate_with_temperature(
+                            encoder_output,
+                            [prompt],
+                            options,
+                            options.temperatures[i + len(pending)],
+                            max_length,
+                            max_initial_timestamp_index,
+                            asynchronous=True,
+                        )[0]
+                    )
+                result = pending.pop(0).result()
+            else:
+                result = None
+                if temperature == 0 and options.adaptive_beam and options.beam_size > 1:
+                    result = self.generate_with_temperature(
+                        encoder_output,
+                        [prompt],
+                        replace(options, beam_size=1),
+                        temperature,
+                        max_length,
+                        max_initial_timestamp_index,
+                    )[0]
+                    escalate = self.needs_beam_search(result, tokenizer, options)
+                    if adaptive_beam_stats is not None:
+                        adaptive_beam_stats["greedy"] += 1
+                        adaptive_beam_stats["escalated"] += escalate
+                    if escalate:
+                        self.logger.debug(
+                            "Low confidence with greedy search, decoding again with "
+                            "beam size %d",
+                            options.beam_size,
+                        )
+                        result = None
+
+                probe_length = options.loop_probe_length
+                if (
+                    result is None
+                    and probe_length is not None
+                    and len(prompt) + probe_length < max_length
+                ):
+                    # decode the first tokens to abort the attempt early when it loops
+                    probe_result = self.generate_with_temperature(
+                        encoder_output,
+                        [prompt],
+                        options,
+                        temperature,
+                        len(prompt) + probe_length,
+                        max_initial_timestamp_index,
+                    )[0]
+                    text_tokens = [
+                        token
+                        for token in probe_result.sequences_ids[0]
+                        if token < tokenizer.eot
+                    ]
+                    if has_repetition_loop(text_tokens):
+                        self.logger.debug(
+                            "Repetition loop detected with temperature %.1f, "
+                            "skipping up to %d decoding steps",
+                            temperature,
+                            max_length - len(prompt) - probe_length,
+                        )
+                        result = probe_result
+
+                if result is None:
+                    result = self.generate_with_temperature(
+                        encoder_output,
+                        [prompt],
+                        options,
+                        temperature,
+                        max_length,
+                        max_initial_timestamp_index,
+                    )[0]
 
             tokens = result.sequences_ids[0]
 
@@ -1452,7 +2422,9 @@ class WhisperModel:
 
             needs_fallback = False
 
-            if options.compression_ratio_threshold is not None:
+            if result is probe_result:
+                needs_fallback = True  # repetition loop
+            elif options.compression_ratio_threshold is not None:
                 if compression_ratio > options.compression_ratio_threshold:
                     needs_fallback = True  # too repetitive
 
@@ -1503,6 +2475,110 @@ class WhisperModel:
 
         return decode_result
 
+    def needs_beam_search(
+        self,
+        result: ctranslate2.models.WhisperGenerationResult,
+        tokenizer: Tokenizer,
+        options: TranscriptionOptions,
+    ) -> bool:
+        """Checks if a greedy decoding result has a low confidence.
+
+        The result fails the compression ratio or log probability checks, or it may be
+        a silent window, which is decided from its average log probability.
+        """
+        tokens = result.sequences_ids[0]
+        seq_len = len(tokens)
+        cum_logprob = result.scores[0] * (seq_len**options.length_penalty)
+        avg_logprob = cum_logprob / (seq_len + 1)
+        compression_ratio = get_compression_ratio(tokenizer.decode(tokens).strip())
+
+        return (
+            (
+                options.compression_ratio_threshold is not None
+                and compression_ratio > options.compression_ratio_threshold
+            )
+            or (
+                options.log_prob_threshold is not None
+                and avg_logprob < options.log_prob_threshold
+            )
+            or (
+                options.no_speech_threshold is not None
+                and result.no_speech_prob > options.no_speech_threshold
+            )
+        )
+
+    def get_max_length(
+        self,
+        prompt_length: int,
+        options: TranscriptionOptions,
+        duration: Optional[float] = None,
+    ) -> int:
+        if options.max_new_tokens is not None:
+            max_length = prompt_length + options.max_new_tokens
+        else:
+            max_length = self.max_length
+
+        if max_length > self.max_length:
+            raise ValueError(
+                f"The length of the prompt is {prompt_length}, and the `max_new_tokens` "
+                f"{max_length - prompt_length}. Thus, the combined length of the prompt "
+                f"and `max_new_tokens` is: {max_length}. This exceeds the "
+                f"`max_length` of the Whisper model: {self.max_length}. "
+                "You should either reduce the length of your prompt, or "
+                "reduce the value of `max_new_tokens`, "
+                f"so that their combined length is less that {self.max_length}."
+            )
+
+        if duration is not None and options.max_tokens_per_second is not None:
+            max_length = min(
+                max_length,
+                prompt_length + ceil(duration * options.max_tokens_per_second),
+            )
+
+        return max_length
+
+    def generate_with_temperature(
+        self,
+        encoder_output: ctranslate2.StorageView,
+        prompts: List[List[int]],
+        options: TranscriptionOptions,
+        temperature: float,
+        max_length: int,
+        max_initial_timestamp_index: int,
+        asynchronous: bool = False,
+    ) -> Union[
+        List[ctranslate2.models.WhisperGenerationResult],
+        List[ctranslate2.models.WhisperGenerationResultAsync],
+    ]:
+        if temperature > 0:
+            kwargs = {
+                "beam_size": 1,
+                "num_hypotheses": options.best_of,
+                "sampling_topk": 0,
+                "sampling_temperature": temperature,
+            }
+        else:
+            kwargs = {
+                "beam_size": options.beam_size,
+                "patience": options.patience,
+            }
+
+        return self.model.generate(
+            encoder_output,
+            prompts,
+            asynchronous=asynchronous,
+            length_penalty=options.length_penalty,
+            repetition_penalty=options.repetition_penalty,
+            no_repeat_ngram_size=options.no_repeat_ngram_size,
+            max_length=max_length,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=options.suppress_blank,
+            suppress_tokens=options.suppress_tokens,
+            max_initial_timestamp_index=max_initial_timestamp_index,
+            **kwargs,
+        )
+
     def get_prompt(
         self,
         tokenizer: Tokenizer,
@@ -1511,32 +2587,10 @@ class WhisperModel:
         prefix: Optional[str] = None,
         hotwords: Optional[str] = None,
     ) -> List[int]:
-        prompt = []
-
-        if previous_tokens or (hotwords and not prefix):
-            prompt.append(tokenizer.sot_prev)
-            if hotwords and not prefix:
-                hotwords_tokens = tokenizer.encode(" " + hotwords.strip())
-                if len(hotwords_tokens) >= self.max_length // 2:
-                    hotwords_tokens = hotwords_tokens[: self.max_length // 2 - 1]
-                prompt.extend(hotwords_tokens)
-            if previous_tokens:
-                prompt.extend(previous_tokens[-(self.max_length // 2 - 1) :])
-
-        prompt.extend(tokenizer.sot_sequence)
-
-        if without_timestamps:
-            prompt.append(tokenizer.no_timestamps)
-
-        if prefix:
-            prefix_tokens = tokenizer.encode(" " + prefix.strip())
-            if len(prefix_tokens) >= self.max_length // 2:
-                prefix_tokens = prefix_tokens[: self.max_length // 2 - 1]
-            if not without_timestamps:
-                prompt.append(tokenizer.timestamp_begin)
-            prompt.extend(prefix_tokens)
-
-        return prompt
+        prompt_builder = PromptBuilder(
+            tokenizer, self.max_length, without_timestamps, prefix, hotwords
+        )
+        return prompt_builder.get_prompt(previous_tokens, use_prefix=True)
 
     def add_word_timestamps(
         self,
@@ -1747,7 +2801,14 @@ class WhisperModel:
         vad_parameters: Union[dict, VadOptions] = None,
         language_detection_segments: int = 1,
         language_detection_threshold: float = 0.5,
-    ) -> Tuple[str, float, List[Tuple[str, float]]]:
+        return_encoder_outputs: bool = False,
+        language_detection_batched: bool = False,
+        language_detection_spread: bool = False,
+        encoder_cache: Optional[EncoderOutputCache] = None,
+    ) -> Union[
+        Tuple[str, float, List[Tuple[str, float]]],
+        Tuple[str, float, List[Tuple[str, float]], List[ctranslate2.StorageView]],
+    ]:
         """
         Use Whisper to detect the language of the input audio or features.
 
@@ -1763,11 +2824,24 @@ class WhisperModel:
             language_detection_threshold: If the maximum probability of the language tokens is
                 higher than this value, the language is detected.
             language_detection_segments: Number of segments to consider for the language detection.
+            return_encoder_outputs: Also return the encoder outputs of the 30-second windows
+                used for the detection, so that the transcription can reuse them.
+            language_detection_batched: Encode all the windows and detect their language in
+                a single batched call instead of one window at a time. The detected language
+                is the same, but all the windows are encoded even when the first one is
+                conclusive.
+            language_detection_spread: Sample the windows evenly across the whole input
+                instead of taking consecutive windows from the start, which helps when the
+                audio begins with a long intro without speech.
+            encoder_cache: Optional cache of encoder outputs (see `EncoderOutputCache`).
 
         Returns:
             language: Detected language.
             languege_probability: Probability of the detected language.
             all_language_probs: List of tuples with all language names and probabilities.
+            encoder_outputs: If `return_encoder_outputs` is True, the encoder outputs of the
+                windows used for the detection. The first window always starts at the
+                beginning of the features.
         """
         assert (
             audio is not None or features is not None
@@ -1777,24 +2851,61 @@ class WhisperModel:
             if vad_filter:
                 speech_chunks = get_speech_timestamps(audio, vad_parameters)
                 audio_chunks, chunks_metadata = collect_chunks(audio, speech_chunks)
-                audio = np.concatenate(audio_chunks, axis=0)
+                audio = audio_chunks[0]
 
-            audio = audio[
-                : language_detection_segments * self.feature_extractor.n_samples
-            ]
+            if not language_detection_spread:
+                audio = audio[
+                    : language_detection_segments * self.feature_extractor.n_samples
+                ]
             features = self.feature_extractor(audio)
 
-        features = features[
-            ..., : language_detection_segments * self.feature_extractor.nb_max_frames
+        nb_max_frames = self.feature_extractor.nb_max_frames
+        num_frames = features.shape[-1]
+        if language_detection_spread and language_detection_segments > 1:
+            last_start = max(num_frames - nb_max_frames, 0)
+            window_starts = sorted(
+                {
+                    round(i * last_start / (language_detection_segments - 1))
+                    for i in range(language_detection_segments)
+                }
+            )
+        else:
+            window_starts = list(
+                range(
+                    0,
+                    min(num_frames, language_detection_segments * nb_max_frames),
+                    nb_max_frames,
+                )
+            )
+        # without features, the language is detected on a padding window
+        windows = [
+            pad_or_trim(features[..., start : start + nb_max_frames])
+            for start in window_starts or [0]
         ]
 
+        encoder_outputs = []
+        if language_detection_batched:
+            batch_encoder_output = self.encode(np.stack(windows), cache=encoder_cache)
+            batch_results = self.model.detect_language(batch_encoder_output)
+            if return_encoder_outputs:
+                encoder_outputs = (
+                    [
+                        select_encoder_output(batch_encoder_output, [i])
+                        for i in range(len(windows))
+                    ]
+                    if len(windows) > 1
+                    else [batch_encoder_output]
+                )
+
         detected_language_info = {}
-        for i in range(0, features.shape[-1], self.feature_extractor.nb_max_frames):
-            encoder_output = self.encode(
-                pad_or_trim(features[..., i : i + self.feature_extractor.nb_max_frames])
-            )
-            # results is a list of tuple[str, float] with language names and probabilities.
-            results = self.model.detect_language(encoder_output)[0]
+        for i, window in enumerate(windows):
+            if language_detection_batched:
+                results = batch_results[i]
+            else:
+                encoder_output = self.encode(window, cache=encoder_cache)
+                encoder_outputs.append(encoder_output)
+                # results is a list of tuple[str, float] with language names and probabilities.
+                results = self.model.detect_language(encoder_output)[0]
 
             # Parse language names to strip out markers
             all_language_probs = [(token[2:-2], prob) for (token, prob) in results]
@@ -1812,8 +2923,645 @@ class WhisperModel:
             )
             language_probability = max(detected_language_info[language])
 
+        if return_encoder_outputs:
+            return language, language_probability, all_language_probs, encoder_outputs
         return language, language_probability, all_language_probs
 
+    def detect_language_batch(
+        self,
+        files: Iterable[Union[str, BinaryIO, np.ndarray]],
+        speech_seconds: float = 30,
+        vad_filter: bool = True,
+        vad_parameters: Optional[Union[dict, VadOptions]] = None,
+        batch_size: int = 8,
+        vad_cache: Optional[VadCache] = None,
+    ) -> Iterable[Union[Tuple[str, float, List[Tuple[str, float]]], Exception]]:
+        """
+        Detect the language of several inputs with batched encoder passes.
+
+        Only the first `speech_seconds` of speech of each input are used, in a single
+        30-second window. The windows of `batch_size` inputs are encoded and scored in a
+        single call, while the next inputs are decoded in a background thread.
+
+        Arguments:
+            files: Paths to the input files (or file-like objects), or audio waveforms.
+            speech_seconds: Number of seconds of speech to use for each input, at most
+                the window duration.
+            vad_filter: Remove the parts of the audio without speech before taking the first
+                `speech_seconds`. The start of the audio is used when no speech is found.
+            vad_parameters: Dictionary of Silero VAD parameters or VadOptions class (see
+                available parameters and default values in the class `VadOptions`).
+            batch_size: Number of inputs to encode in a single call.
+            vad_cache: Optional cache of speech timestamps (see `VadCache`).
+
+        Returns:
+            A generator over the inputs, in order, of tuples with the detected language, its
+            probability and the list of all language names and probabilities.
+            An input that cannot be decoded yields the exception raised while processing
+            it instead, so that one invalid file does not stop the detection of the others.
+            English-only models return "en" for every input that can be decoded, without
+            running the model.
+        """
+        sampling_rate = self.feature_extractor.sampling_rate
+        if not self.model.is_multilingual:
+            for audio in files:
+                if not isinstance(audio, np.ndarray):
+                    try:
+                        decode_audio(audio, sampling_rate=sampling_rate)
+                    except Exception as e:
+                        yield e
+                        continue
+                yield "en", 1, [("en", 1)]
+            return
+
+        num_samples = int(
+            min(speech_seconds * sampling_rate, self.feature_extractor.n_samples)
+        )
+        if vad_filter:
+            if vad_parameters is None:
+                vad_parameters = VadOptions()
+            elif isinstance(vad_parameters, dict):
+                vad_parameters = VadOptions(**vad_parameters)
+
+        def get_window(audio: Union[str, BinaryIO, np.ndarray]) -> np.ndarray:
+            if not isinstance(audio, np.ndarray):
+                audio = decode_audio(audio, sampling_rate=sampling_rate)
+            if vad_filter:
+                speech_chunks = get_speech_timestamps(
+                    audio, vad_parameters, cache=vad_cache
+                )
+                if speech_chunks:
+                    # keep the speech chunks covering the first num_samples samples
+                    total = 0
+                    for count, chunk in enumerate(speech_chunks, 1):
+                        total += chunk["end"] - chunk["start"]
+                        if total >= num_samples:
+                            break
+                    audio = gather_segments(audio, speech_chunks[:count])
+            audio = audio[:num_samples]
+            return pad_or_trim(self.feature_extractor(audio)[..., :-1])
+
+        def get_windows(
+            batch: List[Union[str, BinaryIO, np.ndarray]]
+        ) -> List[Union[np.ndarray, Exception]]:
+            windows = []
+            for audio in batch:
+                try:
+                    windows.append(get_window(audio))
+                except Exception as e:
+                    windows.append(e)
+            return windows
+
+        files = iter(files)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batch = list(itertools.islice(files, batch_size))
+            next_windows = executor.submit(get_windows, batch) if batch else None
+            while next_windows is not None:
+                windows = next_windows.result()
+                batch = list(itertools.islice(files, batch_size))
+                next_windows = executor.submit(get_windows, batch) if batch else None
+
+                valid_windows = [
+                    window for window in windows if not isinstance(window, Exception)
+                ]
+                languages = iter(
+                    self.model.detect_language(self.encode(np.stack(valid_windows)))
+                    if valid_windows
+                    else []
+                )
+                for window in windows:
+                    if isinstance(window, Exception):
+                        yield window
+                        continue
+                    # results is a list of tuple[str, float] with language names and
+                    # probabilities.
+                    results = next(languages)
+                    # Parse language names to strip out markers
+                    all_language_probs = [
+                        (token[2:-2], prob) for (token, prob) in results
+                    ]
+                    language, language_probability = all_language_probs[0]
+                    yield language, language_probability, all_language_probs
+
+
+class ContinuousBatchingPipeline:
+    """Batches the model calls of concurrent sequential transcriptions.
+
+    Each call to `transcribe` runs the sequential transcription of `WhisperModel` with
+    all its options, including `condition_on_previous_text`, but its `encode`,
+    `generate` and `detect_language` calls are sent to a scheduler thread. The scheduler
+    collects the requests of all the active transcriptions and runs the compatible ones
+    as a single batched call, so the transcriptions should be consumed from different
+    threads.
+
+    `generate` requests can be batched together when they use the same decoding
+    options and their `<|startoftranscript|>` token is at the same position. When
+    conditioning on the previous text, this is the case once the prompts reach their
+    maximum length.
+    """
+
+    def __init__(
+        self,
+        model: "WhisperModel",
+        max_batch_size: int = 16,
+        max_wait_time: float = 0.005,
+    ):
+        """Initializes the pipeline.
+
+        Args:
+          model: The WhisperModel instance used by all the transcriptions.
+          max_batch_size: Maximum number of requests to batch in a single model call.
+          max_wait_time: Maximum time in seconds to wait for other requests after
+            receiving the first request of a batch.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.requests = queue.Queue()
+        self.closed = False
+        self.closed_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run_requests, daemon=True)
+        self.thread.start()
+
+    def transcribe(
+        self, audio: Union[str, BinaryIO, np.ndarray], **kwargs
+    ) -> Tuple[Iterable[Segment], TranscriptionInfo]:
+        """Transcribes an input file with batched model calls.
+
+        The arguments are the same as `WhisperModel.transcribe`.
+        """
+        stream_model = copy.copy(self.model)
+        stream_model.model = ScheduledWhisper(self)
+        return stream_model.transcribe(audio, **kwargs)
+
+    def close(self) -> None:
+        """Stops the scheduler thread once the pending requests are processed."""
+        with self.closed_lock:
+            if not self.closed:
+                self.closed = True
+                self.requests.put(None)
+        self.thread.join()
+
+    def submit(
+        self,
+        method: str,
+        inputs: ctranslate2.StorageView,
+        prompts: Optional[List[List[int]]] = None,
+        **kwargs,
+    ) -> List[Future]:
+        """Submits a model call and returns a future for each batch item.
+
+        Raises:
+          RuntimeError: if the pipeline is closed.
+        """
+        if self.closed:
+            raise RuntimeError("Cannot submit a request to a closed pipeline")
+
+        if method == "generate":
+            sot = self.model.hf_tokenizer.token_to_id("<|startoftranscript|>")
+            prompt_shapes = set(
+                (prompt.index(sot), len(prompt) - prompt.index(sot))
+                for prompt in prompts
+            )
+            if len(prompt_shapes) > 1:
+                # the batch cannot be merged with other requests, run it as is
+                future = Future()
+                future.set_result(self.model.model.generate(inputs, prompts, **kwargs))
+                return [future]
+            key = (method, tuple(prompt_shapes), repr(sorted(kwargs.items())))
+        else:
+            key = (method, repr(sorted(kwargs.items())))
+
+        futures = [Future() for _ in range(inputs.shape[0])]
+        with self.closed_lock:
+            # the scheduler thread does not serve the requests queued after close
+            if self.closed:
+                raise RuntimeError("Cannot submit a request to a closed pipeline")
+            self.requests.put((key, inputs, prompts, kwargs, futures))
+        return futures
+
+    def _run_requests(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait_time
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(
+                        self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+                    )
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            groups = {}
+            for request in batch:
+                if request is not None:
+                    groups.setdefault(request[0], []).append(request)
+
+            for key, requests in groups.items():
+                self._run_group(key[0], requests)
+
+    def _run_group(self, method: str, requests: list) -> None:
+        futures = [future for request in requests for future in request[4]]
+        try:
+            inputs = concatenate_storages([request[1] for request in requests])
+            kwargs = requests[0][3]
+
+            if method == "encode":
+                output = self.model.model.encode(inputs, **kwargs)
+                results = [
+                    select_encoder_output(output, [i]) for i in range(len(futures))
+                ]
+            elif method == "generate":
+                prompts = [prompt for request in requests for prompt in request[2]]
+                results = self.model.model.generate(inputs, prompts, **kwargs)
+            else:
+                results = getattr(self.model.model, method)(inputs, **kwargs)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+
+class ScheduledWhisper:
+    """Wraps the CTranslate2 model of a stream to send its calls to a scheduler."""
+
+    def __init__(self, pipeline: ContinuousBatchingPipeline):
+        self.pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self.pipeline.model.model, name)
+
+    def encode(
+        self, features: ctranslate2.StorageView, to_cpu: bool = False
+    ) -> ctranslate2.StorageView:
+        # the batched encoder output is split on the CPU
+        futures = self.pipeline.submit("encode", features)
+        return concatenate_storages([future.result() for future in futures])
+
+    def detect_language(
+        self, features: ctranslate2.StorageView
+    ) -> List[List[Tuple[str, float]]]:
+        futures = self.pipeline.submit("detect_language", features)
+        return [future.result() for future in futures]
+
+    def generate(
+        self,
+        features: ctranslate2.StorageView,
+        prompts: List[List[int]],
+        asynchronous: bool = False,
+        **kwargs,
+    ) -> Union[List[ctranslate2.models.WhisperGenerationResult], List[Future]]:
+        futures = self.pipeline.submit("generate", features, prompts, **kwargs)
+        if len(futures) != len(prompts):
+            # the request was not merged with other requests
+            results = futures[0].result()
+            if not asynchronous:
+                return results
+            futures = [Future() for _ in results]
+            for future, result in zip(futures, results):
+                future.set_result(result)
+            return futures
+        return futures if asynchronous else [future.result() for future in futures]
+
+
+class ModelCascade:
+    """Transcribes with a small model and re-transcribes the doubtful segments.
+
+    The draft model transcribes the whole file. The segments whose average log
+    probability, compression ratio or no_speech probability fail the thresholds are
+    merged into time ranges, which are transcribed again with the larger model through
+    `clip_timestamps`. The other segments are kept from the draft transcription.
+
+    When the larger model is a BatchedInferencePipeline, each range is transcribed in a
+    single window, so the ranges are limited to `chunk_length` seconds.
+    """
+
+    def __init__(
+        self,
+        draft_model: Union["WhisperModel", BatchedInferencePipeline],
+        model: Union["WhisperModel", BatchedInferencePipeline],
+        log_prob_threshold: Optional[float] = -0.5,
+        compression_ratio_threshold: Optional[float] = 2.0,
+        no_speech_threshold: Optional[float] = 0.5,
+    ):
+        """Initializes the cascade.
+
+        Args:
+          draft_model: The model transcribing the whole file, as a WhisperModel or a
+            BatchedInferencePipeline.
+          model: The larger model re-transcribing the flagged segments, as a WhisperModel
+            or a BatchedInferencePipeline. It is loaded once and reused for all files.
+          log_prob_threshold: Flag the draft segments with a lower average log probability.
+          compression_ratio_threshold: Flag the draft segments with a higher gzip
+            compression ratio.
+          no_speech_threshold: Flag the draft segments with a higher no_speech probability.
+        """
+        self.draft_model = draft_model
+        self.model = model
+        self.log_prob_threshold = log_prob_threshold
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.no_speech_threshold = no_speech_threshold
+
+    def transcribe(
+        self,
+        audio: Union[str, BinaryIO, np.ndarray],
+        draft_options: Optional[dict] = None,
+        **kwargs,
+    ) -> Tuple[List[Segment], TranscriptionInfo, CascadeInfo]:
+        """Transcribes an input file with the cascade.
+
+        Args:
+          audio: Path to the input file (or a file-like object), or the audio waveform.
+          draft_options: Additional arguments only passed to the draft model, for example
+            `batch_size` when it is a BatchedInferencePipeline. They take precedence over
+            the arguments in kwargs.
+          kwargs: Arguments passed to the `transcribe` method of both models. When the
+            language is not set, the language detected by the draft model is also used by
+            the larger model.
+
+        Returns:
+          A tuple with:
+
+            - the list of segments in chronological order
+            - the transcription information of the draft model
+            - the escalation information (see `CascadeInfo`)
+        """
+        draft_whisper = (
+            self.draft_model.model
+            if isinstance(self.draft_model, BatchedInferencePipeline)
+            else self.draft_model
+        )
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(
+                audio, sampling_rate=draft_whisper.feature_extractor.sampling_rate
+            )
+
+        # the draft options override the common arguments
+        segments, info = self.draft_model.transcribe(
+            audio, **{**kwargs, **(draft_options or {})}
+        )
+        segments = list(segments)
+
+        max_duration = float("inf")
+        if isinstance(self.model, BatchedInferencePipeline):
+            # a longer range would be trimmed to the window of the batched model
+            max_duration = (
+                kwargs.get("chunk_length")
+                or self.model.model.feature_extractor.chunk_length
+            )
+
+        ranges = []
+        num_escalated_segments = 0
+        for segment in segments:
+            if not self.needs_escalation(segment):
+                continue
+            num_escalated_segments += 1
+            start, end = segment.start, segment.end
+            if ranges and start <= ranges[-1][1]:
+                if max(ranges[-1][1], end) - ranges[-1][0] <= max_duration:
+                    ranges[-1][1] = max(ranges[-1][1], end)
+                    continue
+                start = ranges[-1][1]
+            # a segment longer than the maximum duration is split in several ranges
+            while end - start > max_duration:
+                ranges.append([start, start + max_duration])
+                start += max_duration
+            ranges.append([start, end])
+        ranges = [(start, end) for start, end in ranges if end > start]
+
+        escalated_segments = []
+        if ranges:
+            model_kwargs = dict(kwargs)
+            if model_kwargs.get("language") is None and not model_kwargs.get(
+                "multilingual"
+            ):
+                model_kwargs["language"] = info.language
+            if isinstance(self.model, BatchedInferencePipeline):
+                model_kwargs["clip_timestamps"] = [
+                    {"start": start, "end": end} for start, end in ranges
+                ]
+            else:
+                model_kwargs["clip_timestamps"] = [
+                    timestamp for time_range in ranges for timestamp in time_range
+                ]
+            escalated_segments, _ = self.model.transcribe(audio, **model_kwargs)
+
+        merged_segments = sorted(
+            itertools.chain(
+                (
+                    segment
+                    for segment in segments
+                    if not self.needs_escalation(segment)
+                    and not any(
+                        start <= segment.start and segment.end <= end
+                        for start, end in ranges
+                    )
+                ),
+                escalated_segments,
+            ),
+            key=lambda segment: segment.start,
+        )
+        merged_segments = [
+            replace(segment, id=idx) for idx, segment in enumerate(merged_segments, 1)
+        ]
+
+        cascade_info = CascadeInfo(
+            num_segments=len(segments),
+            num_escalated_segments=num_escalated_segments,
+            escalated_duration=sum(end - start for start, end in ranges),
+            escalated_ranges=ranges,
+        )
+        draft_whisper.logger.info(
+            "Escalated %d of %d segments (%s of audio) to the larger model",
+            num_escalated_segments,
+            len(segments),
+            format_timestamp(cascade_info.escalated_duration),
+        )
+
+        return merged_segments, info, cascade_info
+
+    def needs_escalation(self, segment: Segment) -> bool:
+        """Returns True if the draft segment should be transcribed by the larger model."""
+        return (
+            (
+                self.log_prob_threshold is not None
+                and segment.avg_logprob < self.log_prob_threshold
+            )
+            or (
+                self.compression_ratio_threshold is not None
+                and segment.compression_ratio > self.compression_ratio_threshold
+            )
+            or (
+                self.no_speech_threshold is not None
+                and segment.no_speech_prob > self.no_speech_threshold
+            )
+        )
+
+
+class ModelRouter:
+    """Routes each transcription to a model selected by the detected language.
+
+    A small multilingual model detects the language of each input once, then the input
+    is transcribed by the model of the matching route with this language, so that the
+    routed model does not detect it again. The models given by name are loaded on first
+    use and kept in a pool shared by all the routes using the same name.
+    """
+
+    def __init__(
+        self,
+        lid_model: "WhisperModel",
+        routes: Dict[str, Union[str, "WhisperModel", BatchedInferencePipeline]],
+        default: Optional[Union[str, "WhisperModel", BatchedInferencePipeline]] = None,
+        model_options: Optional[dict] = None,
+        language_detection_segments: int = 1,
+        language_detection_threshold: float = 0.5,
+        vad_filter: bool = False,
+    ):
+        """Initializes the router.
+
+        Args:
+          lid_model: The multilingual model detecting the language.
+          routes: Dictionary mapping language codes to models. A model can be given as a
+            size or path (see `WhisperModel`), a WhisperModel or a BatchedInferencePipeline.
+          default: Model used for the languages without a route. If not set, the language
+            detection model is used.
+          model_options: Additional arguments of `WhisperModel` for the models given by
+            size or path.
+          language_detection_segments: Number of segments to consider for the language
+            detection.
+          language_detection_threshold: If the maximum probability of the language tokens is
+            higher than this value, the language is detected.
+          vad_filter: Detect the language on the first speech segments instead of the start
+            of the audio.
+        """
+        if not lid_model.model.is_multilingual:
+            raise ValueError(
+                "The language detection model must be multilingual, but the model is "
+                "English-only"
+            )
+
+        self.lid_model = lid_model
+        self.routes = routes
+        self.default = default if default is not None else lid_model
+        self.model_options = model_options or {}
+        self.language_detection_segments = language_detection_segments
+        self.language_detection_threshold = language_detection_threshold
+        self.vad_filter = vad_filter
+        self.models = {}
+        self.models_lock = threading.Lock()
+
+    def get_model(
+        self, language: str
+    ) -> Union["WhisperModel", BatchedInferencePipeline]:
+        """Returns the model of the route for a language, loading it if needed."""
+        model = self.routes.get(language, self.default)
+        if not isinstance(model, str):
+            return model
+
+        with self.models_lock:
+            if model not in self.models:
+                self.lid_model.logger.info("Loading model '%s'", model)
+                self.models[model] = WhisperModel(model, **self.model_options)
+            return self.models[model]
+
+    def transcribe(
+        self, audio: Union[str, BinaryIO, np.ndarray], **kwargs
+    ) -> Tuple[Iterable[Segment], TranscriptionInfo]:
+        """Transcribes an input file with the model of its language.
+
+        The arguments are the same as the `transcribe` method of the routed model. When
+        `language` is set, the input is routed without detecting its language.
+        """
+        language = kwargs.pop("language", None)
+        language_probability = 1
+        all_language_probs = None
+
+        if language is None:
+            if not isinstance(audio, np.ndarray):
+                audio = decode_audio(
+                    audio,
+                    sampling_rate=self.lid_model.feature_extractor.sampling_rate,
+                )
+            (
+                language,
+                language_probability,
+                all_language_probs,
+            ) = self.lid_model.detect_language(
+                audio,
+                vad_filter=self.vad_filter,
+                language_detection_segments=self.language_detection_segments,
+                language_detection_threshold=self.language_detection_threshold,
+            )
+            self.lid_model.logger.info(
+                "Detected language '%s' with probability %.2f",
+                language,
+                language_probability,
+            )
+
+        segments, info = self.get_model(language).transcribe(
+            audio, language=language, **kwargs
+        )
+        if all_language_probs is not None:
+            info = replace(
+                info,
+                language_probability=language_probability,
+                all_language_probs=all_language_probs,
+            )
+        return segments, info
+
+
+class SharedEncoderOutputs:
+    """Shares the encoder outputs of the windows encoded by several transcriptions."""
+
+    def __init__(self, model: "WhisperModel", num_streams: int, max_size: int):
+        self.model = model
+        self.num_streams = num_streams
+        self.max_size = max_size
+        # features digest -> (future of the encoder output, indices of the streams)
+        self.outputs = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.num_encoded = 0
+
+    def encode(
+        self,
+        stream_index: int,
+        features: np.ndarray,
+        cache: Optional[EncoderOutputCache] = None,
+    ) -> ctranslate2.StorageView:
+        key = get_features_digest(features)
+        with self.lock:
+            self.num_requests += 1
+            entry = self.outputs.get(key)
+            is_new = entry is None
+            if is_new:
+                entry = self.outputs[key] = (Future(), set())
+                self.num_encoded += 1
+                if len(self.outputs) > self.max_size:
+                    self.outputs.popitem(last=False)
+            future, stream_indices = entry
+            stream_indices.add(stream_index)
+            if len(stream_indices) == self.num_streams:
+                del self.outputs[key]
+
+        if is_new:
+            try:
+                future.set_result(WhisperModel.encode(self.model, features, cache))
+            except Exception as e:
+                future.set_exception(e)
+            self.model.logger.debug(
+                "Encoded %d of %d windows requested by %d transcriptions",
+                self.num_encoded,
+                self.num_requests,
+                self.num_streams,
+            )
+        return future.result()
+
 
 def restore_speech_timestamps(
     segments: Iterable[Segment],
@@ -1824,18 +3572,21 @@ def restore_speech_timestamps(
 
     for segment in segments:
         if segment.words:
-            words = []
-            for word in segment.words:
-                # Ensure the word start and end times are resolved to the same chunk.
-                middle = (word.start + word.end) / 2
-                chunk_index = ts_map.get_chunk_index(middle)
-                word.start = ts_map.get_original_time(word.start, chunk_index)
-                word.end = ts_map.get_original_time(word.end, chunk_index)
-                words.append(word)
+            words = segment.words
+            starts = np.array([word.start for word in words])
+            ends = np.array([word.end for word in words])
+
+            # Ensure the word start and end times are resolved to the same chunk.
+            chunk_indices = ts_map.get_chunk_indices((starts + ends) / 2)
+            starts = ts_map.get_original_times(starts, chunk_indices).tolist()
+            ends = ts_map.get_original_times(ends, chunk_indices).tolist()
+
+            for word, start, end in zip(words, starts, ends):
+                word.start = start
+                word.end = end
 
             segment.start = words[0].start
             segment.end = words[-1].end
-            segment.words = words
 
         else:
             segment.start = ts_map.get_original_time(segment.start)
@@ -1844,12 +3595,129 @@ def restore_speech_timestamps(
         yield segment
 
 
+def sort_packed_segments(
+    segments: Iterable[Segment],
+    chunks_metadata: List[dict],
+    sampling_rate: int,
+    frames_per_second: int,
+) -> Iterable[Segment]:
+    """Yields the segments of out-of-order packed chunks in chronological order.
+
+    A chunk can only contain speech that starts after the first speech segment of the chunk,
+    so the buffered segments can be released as soon as a later chunk is reached.
+    """
+    chunk_seeks = [
+        int(chunk_metadata["offset"] * frames_per_second)
+        for chunk_metadata in chunks_metadata
+    ]
+    chunk_starts = [
+        (
+            chunk_metadata["segments"][0]["start"] / sampling_rate
+            if chunk_metadata["segments"]
+            else 0
+        )
+        for chunk_metadata in chunks_metadata
+    ]
+
+    pending = []
+    idx = 0
+    for order, segment in enumerate(segments):
+        chunk_index = max(bisect.bisect(chunk_seeks, segment.seek) - 1, 0)
+        while pending and pending[0][0] <= chunk_starts[chunk_index]:
+            idx += 1
+            pending_segment = heapq.heappop(pending)[2]
+            pending_segment.id = idx
+            yield pending_segment
+
+        heapq.heappush(pending, (segment.start, order, segment))
+
+    while pending:
+        idx += 1
+        pending_segment = heapq.heappop(pending)[2]
+        pending_segment.id = idx
+        yield pending_segment
+
+
 def get_ctranslate2_storage(segment: np.ndarray) -> ctranslate2.StorageView:
     segment = np.ascontiguousarray(segment)
     segment = ctranslate2.StorageView.from_array(segment)
     return segment
 
 
+def get_features_digest(features: np.ndarray) -> str:
+    """Returns a digest of the features content and shape."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(
+        b"%s:%s:" % (str(features.shape).encode(), features.dtype.str.encode())
+    )
+    digest.update(memoryview(np.ascontiguousarray(features)).cast("B"))
+    return digest.hexdigest()
+
+
+def select_encoder_output(
+    encoder_output: ctranslate2.StorageView, indices: List[int]
+) -> ctranslate2.StorageView:
+    """Returns the encoder output of the batch items at the given indices.
+
+    The selected items are copied to a new storage on the CPU, which is moved back
+    to the model device by the next call using it.
+    """
+    subset = get_ctranslate2_storage(get_storage_array(encoder_output)[indices])
+    return (
+        subset.to(encoder_output.dtype)
+        if subset.dtype != encoder_output.dtype
+        else subset
+    )
+
+
+def concatenate_storages(
+    storages: List[ctranslate2.StorageView],
+) -> ctranslate2.StorageView:
+    """Concatenates storages along the batch dimension into a new storage on the CPU."""
+    if len(storages) == 1:
+        return storages[0]
+
+    dtype = storages[0].dtype
+    storage = get_ctranslate2_storage(
+        np.concatenate([get_storage_array(storage) for storage in storages])
+    )
+    return storage.to(dtype) if storage.dtype != dtype else storage
+
+
+def get_storage_array(storage: ctranslate2.StorageView) -> np.ndarray:
+    if storage.device != "cpu":
+        storage = storage.to_device(ctranslate2.Device.cpu)
+    # NumPy has no bfloat16 type
+    if storage.dtype == ctranslate2.DataType.bfloat16:
+        storage = storage.to(ctranslate2.DataType.float32)
+    return np.asarray(storage)
+
+
+def has_repetition_loop(
+    tokens: List[int], min_repetitions: int = 3, min_loop_length: int = 24
+) -> bool:
+    """Checks if the sequence contains a pattern that is repeated consecutively.
+
+    The repeated part should contain at least `min_repetitions` occurrences of the
+    pattern and at least `min_loop_length` tokens, so that short repetitions that
+    can occur in speech are not considered as loops.
+    """
+    for period in range(1, len(tokens) // min_repetitions + 1):
+        min_length = max(period * min_repetitions, min_loop_length)
+
+        # length of the current run of tokens with this period
+        loop_length = period
+        for i in range(period, len(tokens)):
+            if tokens[i] == tokens[i - period]:
+                loop_length += 1
+                if loop_length >= min_length:
+                    return True
+            else:
+                loop_length = period
+
+    return False
+
+
 def get_compression_ratio(text: str) -> float:
     text_bytes = text.encode("utf-8")
     return len(text_bytes) / len(zlib.compress(text_bytes))
@@ -1,10 +1,13 @@
 import logging
 import os
 import re
+import tempfile
+import threading
 
 from typing import List, Optional, Union
 
 import huggingface_hub
+import numpy as np
 import requests
 
 from tqdm.auto import tqdm
@@ -168,3 +171,96 @@ def get_end(segments: List[dict]) -> Optional[float]:
         (w["end"] for s in reversed(segments) for w in reversed(s["words"])),
         segments[-1]["end"] if segments else None,
     )
+
+
+class DiskCache:
+    """Directory of NumPy arrays with a total size limit.
+
+    The least recently used arrays are removed when the limit is exceeded, down to 90% of
+    the limit. The total size is tracked from the written arrays, and the directory is
+    only scanned again when it goes over the limit.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 1024**3):
+        """Initializes the cache.
+
+        Args:
+          cache_dir: Directory where the arrays are saved. It is created if needed.
+          max_size: Maximum total size of the saved arrays in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size_lock = threading.Lock()
+        self.total_size = self._evict()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the array saved for this key, or None."""
+        path = self._get_path(key)
+        try:
+            array = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return array
+
+    def put(self, key: str, array: np.ndarray) -> None:
+        """Saves the array for this key and removes old entries above the size limit."""
+        path = self._get_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                np.save(tmp_file, array, allow_pickle=False)
+                size = tmp_file.tell()
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+        except OSError as e:
+            get_logger().warning(
+                "Could not write to the cache %s: %s", self.cache_dir, e
+            )
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self.size_lock:
+            self.total_size += size
+            if self.total_size > self.max_size:
+                self.total_size = self._evict(keep=path)
+
+    def _evict(self, keep: Optional[str] = None) -> int:
+        """Removes the least recently used arrays above 90% of the size limit.
+
+        Returns the total size of the remaining arrays.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= self.max_size:
+            return total_size
+
+        # leave some room so that the next writes do not scan the directory again
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size * 0.9:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+        return total_size
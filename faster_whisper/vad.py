@@ -1,13 +1,15 @@
-import bisect
 import functools
+import hashlib
+import json
 import os
 
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 
-from faster_whisper.utils import get_assets_path
+from faster_whisper.utils import DiskCache, get_assets_path
 
 
 # The code below is adapted from https://github.com/snakers4/silero-vad.
@@ -32,6 +34,19 @@ class VadOptions:
       min_silence_duration_ms: In the end of each speech chunk wait for min_silence_duration_ms
         before separating it
       speech_pad_ms: Final speech chunks are padded by speech_pad_ms each side
+      num_workers: Number of threads used to compute the speech probabilities. When greater
+        than 1, the audio is split into shards of shard_duration_s seconds that are processed
+        in parallel and stitched back together in a silent part of their overlap. The model
+        state starts from zero at each shard and takes tens of seconds to converge again,
+        so each shard is preceded by shard_warmup_s seconds of audio whose probabilities
+        are discarded. Without warm-up, the speech boundaries can move by seconds and
+        chunks can be merged or split; with 30 seconds, they stayed within 0.1 second of
+        a single pass on speech with short pauses.
+      shard_duration_s: Duration of each shard in seconds when num_workers is greater than 1.
+      shard_overlap_s: Duration in seconds of the audio shared by two consecutive shards on
+        each side of their boundary. It should be long enough to contain a pause.
+      shard_warmup_s: Duration in seconds of the audio processed before each shard to warm up
+        the model state.
     """
 
     threshold: float = 0.5
@@ -40,12 +55,17 @@ class VadOptions:
     max_speech_duration_s: float = float("inf")
     min_silence_duration_ms: int = 2000
     speech_pad_ms: int = 400
+    num_workers: int = 1
+    shard_duration_s: float = 600
+    shard_overlap_s: float = 5
+    shard_warmup_s: float = 30
 
 
 def get_speech_timestamps(
     audio: np.ndarray,
     vad_options: Optional[VadOptions] = None,
     sampling_rate: int = 16000,
+    cache: Optional["VadCache"] = None,
     **kwargs,
 ) -> List[dict]:
     """This method is used for splitting long audios into speech chunks using silero VAD.
@@ -54,6 +74,8 @@ def get_speech_timestamps(
       audio: One dimensional float array.
       vad_options: Options for VAD processing.
       sampling rate: Sampling rate of the audio.
+      cache: Optional cache of previous results. When the same audio was already processed
+        with the same options, the VAD model is not run.
       kwargs: VAD options passed as keyword arguments for backward compatibility.
 
     Returns:
@@ -62,6 +84,14 @@ def get_speech_timestamps(
     if vad_options is None:
         vad_options = VadOptions(**kwargs)
 
+    if cache is not None:
+        cache_key = cache.get_key(audio, vad_options, sampling_rate)
+        cached_speeches = cache.get(cache_key)
+        if cached_speeches is not None:
+            return [
+                {"start": int(start), "end": int(end)} for start, end in cached_speeches
+            ]
+
     threshold = vad_options.threshold
     neg_threshold = vad_options.neg_threshold
     min_speech_duration_ms = vad_options.min_speech_duration_ms
@@ -86,13 +116,34 @@ def get_speech_timestamps(
     padded_audio = np.pad(
         audio, (0, window_size_samples - audio.shape[0] % window_size_samples)
     )
-    speech_probs = model(padded_audio.reshape(1, -1)).squeeze(0)
+
+    if neg_threshold is None:
+        neg_threshold = max(threshold - 0.15, 0.01)
+
+    shard_size = (
+        int(vad_options.shard_duration_s * sampling_rate) // window_size_samples
+    )
+    if vad_options.num_workers > 1 and padded_audio.shape[0] > (
+        shard_size * window_size_samples
+    ):
+        speech_probs = get_sharded_speech_probs(
+            model,
+            padded_audio,
+            shard_size=shard_size,
+            overlap_size=int(vad_options.shard_overlap_s * sampling_rate)
+            // window_size_samples,
+            warmup_size=int(vad_options.shard_warmup_s * sampling_rate)
+            // window_size_samples,
+            neg_threshold=neg_threshold,
+            num_workers=vad_options.num_workers,
+            window_size_samples=window_size_samples,
+        )
+    else:
+        speech_probs = model(padded_audio.reshape(1, -1)).squeeze(0)
 
     triggered = False
     speeches = []
     current_speech = {}
-    if neg_threshold is None:
-        neg_threshold = max(threshold - 0.15, 0.01)
 
     # to save potential segment end (and tolerate some silence)
     temp_end = 0
@@ -180,16 +231,112 @@ def get_speech_timestamps(
                 min(audio_length_samples, speech["end"] + speech_pad_samples)
             )
 
+    if cache is not None:
+        cache.put(
+            cache_key,
+            np.array(
+                [(speech["start"], speech["end"]) for speech in speeches],
+                dtype=np.int64,
+            ).reshape(-1, 2),
+        )
+
     return speeches
 
 
+def get_sharded_speech_probs(
+    model: "SileroVADModel",
+    audio: np.ndarray,
+    shard_size: int,
+    overlap_size: int,
+    neg_threshold: float,
+    num_workers: int,
+    window_size_samples: int = 512,
+    warmup_size: int = 0,
+) -> np.ndarray:
+    """Computes the speech probabilities of overlapping audio shards in parallel.
+
+    Each shard is extended by overlap_size windows on both sides. The model is first run
+    on the warmup_size windows before the extended shard, and their probabilities are
+    discarded, so that the recurrent state is closer to the one of a single pass. The
+    probabilities of two consecutive shards are joined at a window of their overlap that
+    both consider silent, so that the recurrent state is never switched in the middle of
+    speech.
+
+    Args:
+      model: VAD model instance.
+      audio: One dimensional float array with a length multiple of window_size_samples.
+      shard_size: Number of VAD windows per shard.
+      overlap_size: Number of VAD windows shared with the neighboring shard on each side.
+      neg_threshold: Probabilities below this value are considered as silence.
+      num_workers: Number of threads running the model.
+      window_size_samples: Number of samples per VAD window.
+      warmup_size: Number of VAD windows processed before each shard to warm up the state.
+
+    Returns:
+      Speech probabilities for each window of the audio.
+    """
+    num_windows = audio.shape[0] // window_size_samples
+    shard_size = max(shard_size, 1)
+    overlap_size = min(max(overlap_size, 0), shard_size // 2)
+    boundaries = list(range(0, num_windows, shard_size)) + [num_windows]
+
+    def run_shard(index):
+        start = max(boundaries[index] - overlap_size, 0)
+        warmup_start = max(start - warmup_size, 0)
+        end = min(boundaries[index + 1] + overlap_size, num_windows)
+        shard_audio = audio[
+            warmup_start * window_size_samples : end * window_size_samples
+        ]
+        probs = model(shard_audio.reshape(1, -1)).squeeze(0)
+        return start, probs[start - warmup_start :]
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        shards = list(executor.map(run_shard, range(len(boundaries) - 1)))
+
+    speech_probs = []
+    position = 0
+    for index, (start, probs) in enumerate(shards):
+        if index + 1 < len(shards):
+            next_start, next_probs = shards[index + 1]
+            boundary = boundaries[index + 1]
+            overlap = slice(next_start, min(boundary + overlap_size, num_windows))
+            silent = (
+                probs[overlap.start - start : overlap.stop - start] < neg_threshold
+            ) & (next_probs[: overlap.stop - next_start] < neg_threshold)
+            # Prefer the silent window closest to the shard boundary.
+            candidates = np.flatnonzero(silent.reshape(-1)) + next_start
+            if candidates.size > 0:
+                cut = int(candidates[np.argmin(np.abs(candidates - boundary))])
+            else:
+                cut = boundary
+        else:
+            cut = num_windows
+
+        speech_probs.append(probs[position - start : cut - start])
+        position = cut
+
+    return np.concatenate(speech_probs, axis=0)
+
+
 def collect_chunks(
     audio: np.ndarray,
     chunks: List[dict],
     sampling_rate: int = 16000,
     max_duration: float = float("inf"),
+    lookahead: int = 0,
 ) -> Tuple[List[np.ndarray], List[Dict[str, float]]]:
-    """This function merges the chunks of audio into chunks of max_duration (s) length."""
+    """This function merges the chunks of audio into chunks of max_duration (s) length.
+
+    The merged chunks are first described by their speech segments (sample offsets into
+    the original audio), then each one is gathered in a single preallocated array so that
+    every speech sample is copied at most once.
+
+    With lookahead > 0, up to lookahead previous merged chunks remain open and each speech
+    chunk is added to the first open one that can still hold it (first-fit). This reduces
+    the number of merged chunks, but a merged chunk can then contain speech that comes after
+    speech of the next merged chunk. The speech chunks keep their order within a merged
+    chunk and the "offset" metadata is the total duration of the previous merged chunks.
+    """
     if not chunks:
         chunk_metadata = {
             "offset": 0,
@@ -198,49 +345,60 @@ def collect_chunks(
         }
         return [np.array([], dtype=np.float32)], [chunk_metadata]
 
-    audio_chunks = []
-    chunks_metadata = []
-
-    current_segments = []
-    current_duration = 0
-    total_duration = 0
-    current_audio = np.array([], dtype=np.float32)
+    max_samples = max_duration * sampling_rate
+    windows = []
+    num_closed = 0
 
     for chunk in chunks:
-        if (
-            current_duration + chunk["end"] - chunk["start"]
-            > max_duration * sampling_rate
-        ):
-            audio_chunks.append(current_audio)
-            chunk_metadata = {
+        chunk_duration = chunk["end"] - chunk["start"]
+        for window in windows[num_closed:]:
+            if window["duration"] + chunk_duration <= max_samples:
+                window["segments"].append(chunk)
+                window["duration"] += chunk_duration
+                break
+        else:
+            windows.append({"segments": [chunk], "duration": chunk_duration})
+            num_closed = max(num_closed, len(windows) - 1 - lookahead)
+
+    chunks_metadata = []
+    total_duration = 0
+    for window in windows:
+        chunks_metadata.append(
+            {
                 "offset": total_duration / sampling_rate,
-                "duration": current_duration / sampling_rate,
-                "segments": current_segments,
+                "duration": window["duration"] / sampling_rate,
+                "segments": window["segments"],
             }
-            total_duration += current_duration
-            chunks_metadata.append(chunk_metadata)
+        )
+        total_duration += window["duration"]
 
-            current_segments = []
+    audio_chunks = [
+        gather_segments(audio, chunk_metadata["segments"])
+        for chunk_metadata in chunks_metadata
+    ]
+    return audio_chunks, chunks_metadata
 
-            current_audio = audio[chunk["start"] : chunk["end"]]
-            current_duration = chunk["end"] - chunk["start"]
-        else:
-            current_segments.append(chunk)
-            current_audio = np.concatenate(
-                (current_audio, audio[chunk["start"] : chunk["end"]])
-            )
 
-            current_duration += chunk["end"] - chunk["start"]
+def gather_segments(audio: np.ndarray, segments: List[dict]) -> np.ndarray:
+    """Returns the concatenation of the audio segments, copying each sample once.
 
-    audio_chunks.append(current_audio)
+    A single segment is returned as a view of the original audio.
+    """
+    if len(segments) == 1:
+        return audio[segments[0]["start"] : segments[0]["end"]]
 
-    chunk_metadata = {
-        "offset": total_duration / sampling_rate,
-        "duration": current_duration / sampling_rate,
-        "segments": current_segments,
-    }
-    chunks_metadata.append(chunk_metadata)
-    return audio_chunks, chunks_metadata
+    # the slices are views, and are shorter than the segments ending after the audio
+    slices = [audio[segment["start"] : segment["end"]] for segment in segments]
+    output = np.empty(
+        sum(len(audio_slice) for audio_slice in slices), dtype=audio.dtype
+    )
+
+    position = 0
+    for audio_slice in slices:
+        output[position : position + len(audio_slice)] = audio_slice
+        position += len(audio_slice)
+
+    return output
 
 
 class SpeechTimestampsMap:
@@ -249,18 +407,14 @@ class SpeechTimestampsMap:
     def __init__(self, chunks: List[dict], sampling_rate: int, time_precision: int = 2):
         self.sampling_rate = sampling_rate
         self.time_precision = time_precision
-        self.chunk_end_sample = []
-        self.total_silence_before = []
 
-        previous_end = 0
-        silent_samples = 0
+        starts = np.array([chunk["start"] for chunk in chunks], dtype=np.int64)
+        ends = np.array([chunk["end"] for chunk in chunks], dtype=np.int64)
+        previous_ends = np.concatenate(([0], ends[:-1]))
+        silent_samples = np.cumsum(starts - previous_ends)
 
-        for chunk in chunks:
-            silent_samples += chunk["start"] - previous_end
-            previous_end = chunk["end"]
-
-            self.chunk_end_sample.append(chunk["end"] - silent_samples)
-            self.total_silence_before.append(silent_samples / sampling_rate)
+        self.chunk_end_sample = ends - silent_samples
+        self.total_silence_before = silent_samples / sampling_rate
 
     def get_original_time(
         self,
@@ -271,18 +425,86 @@ class SpeechTimestampsMap:
         if chunk_index is None:
             chunk_index = self.get_chunk_index(time, is_end)
 
-        total_silence_before = self.total_silence_before[chunk_index]
+        total_silence_before = float(self.total_silence_before[chunk_index])
         return round(total_silence_before + time, self.time_precision)
 
     def get_chunk_index(self, time: float, is_end: bool = False) -> int:
-        sample = int(time * self.sampling_rate)
-        if sample in self.chunk_end_sample and is_end:
-            return self.chunk_end_sample.index(sample)
+        return int(self.get_chunk_indices(np.array([time]), is_end)[0])
 
-        return min(
-            bisect.bisect(self.chunk_end_sample, sample),
-            len(self.chunk_end_sample) - 1,
+    def get_original_times(
+        self,
+        times: np.ndarray,
+        chunk_indices: Optional[np.ndarray] = None,
+        is_end: bool = False,
+    ) -> np.ndarray:
+        """Vectorized version of get_original_time for an array of times."""
+        times = np.asarray(times, dtype=np.float64)
+        if chunk_indices is None:
+            chunk_indices = self.get_chunk_indices(times, is_end)
+
+        original_times = self.total_silence_before[chunk_indices] + times
+        # np.round scales by a power of 10 before rounding, which rounds some float ties
+        # differently from the built-in round used by get_original_time
+        return np.array(
+            [round(time, self.time_precision) for time in original_times.tolist()],
+            dtype=np.float64,
+        )
+
+    def get_chunk_indices(self, times: np.ndarray, is_end: bool = False) -> np.ndarray:
+        """Vectorized version of get_chunk_index for an array of times."""
+        samples = (np.asarray(times, dtype=np.float64) * self.sampling_rate).astype(
+            np.int64
         )
+        indices = np.searchsorted(self.chunk_end_sample, samples, side="right")
+
+        if is_end:
+            # a time at the exact end of a chunk belongs to this chunk
+            left_indices = np.searchsorted(self.chunk_end_sample, samples, side="left")
+            is_chunk_end = (left_indices < len(self.chunk_end_sample)) & (
+                self.chunk_end_sample[
+                    np.minimum(left_indices, len(self.chunk_end_sample) - 1)
+                ]
+                == samples
+            )
+            indices = np.where(is_chunk_end, left_indices, indices)
+
+        return np.minimum(indices, len(self.chunk_end_sample) - 1)
+
+
+class VadCache(DiskCache):
+    """Cache of speech timestamps saved as compact NumPy arrays.
+
+    Entries are keyed by the audio content, the VAD model files and the VAD options, so
+    that processing the same files again skips the VAD model entirely.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 64 * 1024**2):
+        super().__init__(cache_dir, max_size)
+
+    def get_key(
+        self, audio: np.ndarray, vad_options: VadOptions, sampling_rate: int
+    ) -> str:
+        options = asdict(vad_options)
+        # sharded probabilities can differ from a single pass, but the number of workers
+        # does not change the result once the audio is sharded
+        options["num_workers"] = vad_options.num_workers > 1
+
+        key = hashlib.blake2b(digest_size=20)
+        key.update(get_vad_model_digest().encode())
+        key.update(json.dumps(options, sort_keys=True).encode())
+        key.update(b"%d:%s:" % (sampling_rate, audio.dtype.str.encode()))
+        key.update(memoryview(np.ascontiguousarray(audio)).cast("B"))
+        return key.hexdigest()
+
+
+@functools.lru_cache
+def get_vad_model_digest() -> str:
+    """Returns a digest of the VAD model files."""
+    digest = hashlib.blake2b(digest_size=20)
+    for filename in ("silero_encoder_v5.onnx", "silero_decoder_v5.onnx"):
+        with open(os.path.join(get_assets_path(), filename), "rb") as model_file:
+            digest.update(model_file.read())
+    return digest.hexdigest()
 
 
 @functools.lru_cache
@@ -341,10 +563,14 @@ class SileroVADModel:
         )
 
         batched_audio = audio.reshape(batch_size, -1, num_samples)
-        context = batched_audio[..., -context_size_samples:]
+        # Copy the context so that the input audio is not modified below.
+        context = batched_audio[..., -context_size_samples:].copy()
         context[:, -1] = 0
         context = np.roll(context, 1, 1)
         batched_audio = np.concatenate([context, batched_audio], 2)
+        # The context used to be a view that zeroed the end of the last window in the
+        # input audio. Zero it in the concatenated copy to keep the same probabilities.
+        batched_audio[:, -1, -context_size_samples:] = 0
 
         batched_audio = batched_audio.reshape(-1, num_samples + context_size_samples)
 
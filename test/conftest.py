@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def data_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="session")
+def jfk_path(data_dir):
+    return os.path.join(data_dir, "jfk.flac")
+
+
+@pytest.fixture(scope="session")
+def model_path():
+    # a model size or a path to a converted model, e.g. to run the tests offline
+    return os.environ.get("FASTER_WHISPER_TEST_MODEL", "tiny")
@@ -0,0 +1,728 @@
+import itertools
+import logging
+import os
+
+from dataclasses import replace
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from faster_whisper import (
+    BatchedInferencePipeline,
+    ContinuousBatchingPipeline,
+    ModelCascade,
+    ModelRouter,
+    WhisperModel,
+    decode_audio,
+)
+from faster_whisper.transcribe import (
+    EncoderOutputCache,
+    Segment,
+    TranscriptionInfo,
+    get_storage_array,
+)
+
+
+class MultilingualModel:
+    """Wraps a CTranslate2 model to detect a fixed language on every window."""
+
+    is_multilingual = True
+
+    def __init__(self, model, language):
+        self._model = model
+        self._language = language
+        self.num_detections = 0
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def detect_language(self, encoder_output):
+        self.num_detections += encoder_output.shape[0]
+        return [[("<|%s|>" % self._language, 1.0)]] * encoder_output.shape[0]
+
+
+class EnglishOnlyModel:
+    """Wraps a CTranslate2 model to make it English-only."""
+
+    is_multilingual = False
+
+    def __init__(self, model):
+        self._model = model
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class EncodeCountingModel:
+    """Wraps a CTranslate2 model to count the encoded windows."""
+
+    def __init__(self, model):
+        self._model = model
+        self.num_encoded = 0
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def encode(self, features, **kwargs):
+        self.num_encoded += features.shape[0]
+        return self._model.encode(features, **kwargs)
+
+
+class StubModel:
+    """Transcribes any input to fixed segments in a fixed language."""
+
+    feature_extractor = SimpleNamespace(sampling_rate=16000, chunk_length=30)
+    logger = logging.getLogger("faster_whisper")
+
+    model = SimpleNamespace(is_multilingual=True)
+
+    def __init__(self, segments=(), language="en"):
+        self.segments = list(segments)
+        self.language = language
+        self.calls = []
+        self.num_detections = 0
+
+    def detect_language(self, audio, **kwargs):
+        self.num_detections += 1
+        return self.language, 0.9, [(self.language, 0.9)]
+
+    def transcribe(self, audio, **kwargs):
+        self.calls.append(kwargs)
+        info = TranscriptionInfo(
+            language=kwargs.get("language") or self.language,
+            language_probability=1,
+            duration=audio.shape[0] / 16000,
+            duration_after_vad=audio.shape[0] / 16000,
+            all_language_probs=None,
+            transcription_options=None,
+            vad_options=None,
+        )
+        return iter(self.segments), info
+
+
+def make_segment(start, end, text="", avg_logprob=-0.1):
+    return Segment(
+        id=0,
+        seek=0,
+        start=start,
+        end=end,
+        text=text,
+        tokens=[],
+        avg_logprob=avg_logprob,
+        compression_ratio=1.0,
+        no_speech_prob=0.0,
+        words=None,
+        temperature=0.0,
+    )
+
+
+def test_window_batches_multilingual_initial_prompt(model_path, jfk_path):
+    model = WhisperModel(model_path)
+    model.model = MultilingualModel(model.model, "fr")
+    audio = np.tile(decode_audio(jfk_path), 7)
+
+    prompts = []
+    generate_batch_with_fallback = model.generate_batch_with_fallback
+
+    def record_prompts(encoder_output, batch_prompts, *args, **kwargs):
+        prompts.extend(list(prompt) for prompt in batch_prompts)
+        return generate_batch_with_fallback(
+            encoder_output, batch_prompts, *args, **kwargs
+        )
+
+    model.generate_batch_with_fallback = record_prompts
+
+    segments, _ = model.transcribe(
+        audio,
+        multilingual=True,
+        initial_prompt="The president is speaking.",
+        condition_on_previous_text=False,
+        window_batch_size=2,
+        max_new_tokens=20,
+    )
+    list(segments)
+
+    tokenizer = model.get_tokenizer("transcribe", "fr")
+    initial_prompt_tokens = tokenizer.encode(" The president is speaking.")
+    prompts_with_context = [
+        prompt for prompt in prompts if prompt[0] == tokenizer.sot_prev
+    ]
+
+    assert len(prompts) >= 3
+    assert len(prompts_with_context) == 1
+    prompt = prompts_with_context[0]
+    assert prompt[1 : prompt.index(tokenizer.sot)] == initial_prompt_tokens
+    for prompt in prompts:
+        assert prompt[prompt.index(tokenizer.sot) + 1] == tokenizer.language
+
+
+@pytest.mark.parametrize(
+    "audio,vad_filter",
+    [
+        (np.zeros(0, dtype=np.float32), False),
+        (np.zeros(16000 * 5, dtype=np.float32), True),
+    ],
+)
+def test_detect_language_without_content(model_path, audio, vad_filter):
+    model = WhisperModel(model_path)
+    model.model = MultilingualModel(model.model, "fr")
+
+    segments, info = model.transcribe(audio, vad_filter=vad_filter)
+
+    assert list(segments) == []
+    assert info.language == "fr"
+
+
+def test_language_not_reused_after_silent_window(model_path, jfk_path):
+    model = WhisperModel(model_path)
+    model.model = MultilingualModel(model.model, "fr")
+    audio = np.tile(decode_audio(jfk_path), 7)
+
+    # every window is skipped as silent, so each one detects its language
+    segments, _ = model.transcribe(
+        audio,
+        language="fr",
+        multilingual=True,
+        language_reuse_threshold=0.5,
+        no_speech_threshold=0.0,
+        log_prob_threshold=None,
+        temperature=0.0,
+    )
+
+    assert list(segments) == []
+    assert model.model.num_detections == 3
+
+
+def test_window_batches_match_sequential(model_path, jfk_path):
+    model = WhisperModel(model_path)
+    audio = np.tile(decode_audio(jfk_path), 7)
+    options = dict(condition_on_previous_text=False, temperature=0.0)
+
+    segments, _ = model.transcribe(audio, **options)
+    sequential_times = [
+        time for segment in segments for time in (segment.start, segment.end)
+    ]
+    segments, _ = model.transcribe(audio, window_batch_size=4, **options)
+    batched_times = [
+        time for segment in segments for time in (segment.start, segment.end)
+    ]
+
+    assert batched_times == sorted(batched_times)
+    # the windows after a short unfinished tail start a few frames later
+    assert batched_times == pytest.approx(sequential_times, abs=0.1)
+
+
+def test_cascade_splits_long_ranges_for_batched_model(model_path, jfk_path):
+    draft_model = WhisperModel(model_path)
+    model = BatchedInferencePipeline(WhisperModel(model_path))
+    audio = np.tile(decode_audio(jfk_path), 7)
+
+    # consecutive doubtful draft segments covering the first 70 seconds
+    draft_segments = [
+        Segment(
+            id=idx,
+            seek=0,
+            start=start,
+            end=start + 10.0,
+            text="",
+            tokens=[],
+            avg_logprob=-1.0,
+            compression_ratio=1.0,
+            no_speech_prob=0.0,
+            words=None,
+            temperature=0.0,
+        )
+        for idx, start in enumerate(range(0, 70, 10), 1)
+    ]
+    draft_model.transcribe = lambda audio, **kwargs: (iter(draft_segments), None)
+
+    clip_timestamps = []
+    transcribe = model.transcribe
+
+    def record_clip_timestamps(audio, **kwargs):
+        clip_timestamps.extend(kwargs["clip_timestamps"])
+        return transcribe(audio, **kwargs)
+
+    model.transcribe = record_clip_timestamps
+
+    cascade = ModelCascade(draft_model, model)
+    segments, _, cascade_info = cascade.transcribe(
+        audio, language="en", max_new_tokens=20
+    )
+
+    assert cascade_info.num_escalated_segments == len(draft_segments)
+    assert cascade_info.escalated_ranges == [(0, 30), (30, 60), (60, 70)]
+    assert clip_timestamps == [
+        {"start": 0, "end": 30},
+        {"start": 30, "end": 60},
+        {"start": 60, "end": 70},
+    ]
+    assert all(segment not in draft_segments for segment in segments)
+
+
+def test_continuous_batching_submit_after_close():
+    pipeline = ContinuousBatchingPipeline(model=None)
+    pipeline.close()
+    pipeline.close()
+
+    with pytest.raises(RuntimeError):
+        pipeline.submit("encode", np.zeros((1, 80, 3000), dtype=np.float32))
+
+
+def test_detect_language_batch_invalid_file(model_path, jfk_path, tmp_path):
+    model = WhisperModel(model_path)
+    invalid_path = str(tmp_path / "invalid.wav")
+    with open(invalid_path, "wb") as invalid_file:
+        invalid_file.write(b"not audio")
+
+    ct2_model = model.model
+
+    for detection_model, language in (
+        (EnglishOnlyModel(ct2_model), "en"),
+        (MultilingualModel(ct2_model, "fr"), "fr"),
+    ):
+        model.model = detection_model
+        results = list(
+            model.detect_language_batch(
+                [jfk_path, invalid_path, jfk_path], vad_filter=False, batch_size=2
+            )
+        )
+
+        assert len(results) == 3
+        assert isinstance(results[1], Exception)
+        assert results[0][0] == results[2][0] == language
+
+
+# without timestamps the next window starts at the end of the current one, so the
+# speculatively encoded window is used
+@pytest.mark.parametrize("without_timestamps", [False, True])
+def test_speculative_encode(model_path, jfk_path, without_timestamps):
+    model = WhisperModel(model_path)
+    audio = np.tile(decode_audio(jfk_path), 4)
+    options = dict(without_timestamps=without_timestamps, temperature=0.0)
+
+    segments, _ = model.transcribe(audio, **options)
+    segments = list(segments)
+    speculative_segments, _ = model.transcribe(
+        audio, speculative_encode=True, **options
+    )
+
+    assert len(segments) > 0
+    assert list(speculative_segments) == segments
+
+
+def test_batched_fallback_decodes_failed_items_again(model_path, jfk_path):
+    model = WhisperModel(model_path)
+    pipeline = BatchedInferencePipeline(model)
+    audio = np.tile(decode_audio(jfk_path), 2)
+    options = dict(
+        batch_size=8,
+        chunk_length=5,
+        vad_filter=False,
+        clip_timestamps=[
+            {"start": start, "end": start + 5} for start in range(0, 20, 5)
+        ],
+        log_prob_threshold=-1.0,
+        no_speech_threshold=None,
+        compression_ratio_threshold=None,
+    )
+
+    segments, _ = pipeline.transcribe(audio, temperature=0.0, **options)
+    segments = list(segments)
+
+    # the items are identified by their encoder output, and the second and fourth
+    # items fail at temperature 0
+    item_indices = {}
+    decoded_items = []
+    generate_with_temperature = model.generate_with_temperature
+
+    def fail_items(encoder_output, prompts, options, temperature, *args, **kwargs):
+        results = generate_with_temperature(
+            encoder_output, prompts, options, temperature, *args, **kwargs
+        )
+        rows = [row.tobytes() for row in get_storage_array(encoder_output)]
+        if not item_indices:
+            item_indices.update((row, index) for index, row in enumerate(rows))
+        indices = [item_indices[row] for row in rows]
+        decoded_items.append((temperature, indices))
+        return [
+            SimpleNamespace(
+                sequences_ids=result.sequences_ids,
+                scores=[-10.0] if temperature == 0 and index in (1, 3) else [0.0],
+                no_speech_prob=result.no_speech_prob,
+            )
+            for index, result in zip(indices, results)
+        ]
+
+    model.generate_with_temperature = fail_items
+    fallback_segments, _ = pipeline.transcribe(audio, temperature=[0.0, 0.5], **options)
+    fallback_segments = list(fallback_segments)
+
+    assert decoded_items == [(0.0, [0, 1, 2, 3]), (0.5, [1, 3])]
+    for segment, fallback_segment in zip(segments, fallback_segments):
+        if fallback_segment.seek in (500, 1500):
+            assert fallback_segment.temperature == 0.5
+        else:
+            assert fallback_segment.temperature == 0.0
+            assert fallback_segment.tokens == segment.tokens
+
+
+def test_batched_fallback_without_thresholds(model_path, jfk_path):
+    pipeline = BatchedInferencePipeline(WhisperModel(model_path))
+    audio = np.tile(decode_audio(jfk_path), 4)
+    options = dict(
+        log_prob_threshold=None,
+        no_speech_threshold=None,
+        compression_ratio_threshold=None,
+    )
+
+    segments, _ = pipeline.transcribe(audio, temperature=0.0, **options)
+    segments = list(segments)
+    fallback_segments, _ = pipeline.transcribe(
+        audio, temperature=[0.0, 0.2, 0.4], **options
+    )
+
+    assert len(segments) > 0
+    assert list(fallback_segments) == segments
+
+
+def test_bucket_batches(model_path, jfk_path):
+    pipeline = BatchedInferencePipeline(WhisperModel(model_path))
+    jfk = decode_audio(jfk_path)
+    silence = np.zeros(2 * 16000, dtype=np.float32)
+    # speech chunks of varied durations, so that the buckets differ from the
+    # consecutive batches
+    audio = np.concatenate(
+        [
+            part
+            for duration in (6, 2, 6, 2, 6, 2)
+            for part in (jfk[: duration * 16000], silence)
+        ]
+    )
+    options = dict(batch_size=2, chunk_length=7, chunk_lookahead=0, temperature=0.0)
+
+    segments, _ = pipeline.transcribe(audio, **options)
+    segments = list(segments)
+    bucketed_segments, _ = pipeline.transcribe(audio, bucket_batches=True, **options)
+
+    assert len(segments) > 0
+    assert list(bucketed_segments) == segments
+
+
+def get_num_tokens_per_window(segments):
+    num_tokens = {}
+    for segment in segments:
+        num_tokens[segment.seek] = num_tokens.get(segment.seek, 0) + len(segment.tokens)
+    return num_tokens
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_max_tokens_per_second(model_path, jfk_path, batched):
+    model = WhisperModel(model_path)
+    if batched:
+        model = BatchedInferencePipeline(model)
+    audio = np.tile(decode_audio(jfk_path), 4)
+    options = dict(without_timestamps=True, temperature=0.0)
+
+    segments, _ = model.transcribe(audio, **options)
+    segments = list(segments)
+    budget_segments, _ = model.transcribe(audio, max_tokens_per_second=1000, **options)
+    assert list(budget_segments) == segments
+
+    # a window lasts at most 30 seconds, and a chunk is rounded up to 32 seconds
+    budget_segments, _ = model.transcribe(audio, max_tokens_per_second=1, **options)
+    assert max(get_num_tokens_per_window(segments).values()) > 32
+    assert 0 < max(get_num_tokens_per_window(budget_segments).values()) <= 32
+
+
+def test_early_no_speech_threshold(model_path, jfk_path):
+    model = WhisperModel(model_path)
+    audio = np.tile(decode_audio(jfk_path), 7)
+    # the windows and their prompts do not change when some of them are skipped
+    options = dict(
+        without_timestamps=True, condition_on_previous_text=False, temperature=0.0
+    )
+
+    segments, _ = model.transcribe(audio, **options)
+    segments = list(segments)
+    early_segments, _ = model.transcribe(
+        audio, early_no_speech_threshold=1.0, **options
+    )
+    assert list(early_segments) == segments
+
+    # the early check skips the same windows as the check after the decoding when the
+    # log probability cannot override it
+    no_speech_probs = sorted(segment.no_speech_prob for segment in segments)
+    no_speech_threshold = no_speech_probs[len(no_speech_probs) // 2]
+    segments, _ = model.transcribe(
+        audio,
+        no_speech_threshold=no_speech_threshold,
+        log_prob_threshold=None,
+        **options,
+    )
+    segments = list(segments)
+    early_segments, _ = model.transcribe(
+        audio,
+        early_no_speech_threshold=no_speech_threshold,
+        no_speech_threshold=None,
+        log_prob_threshold=None,
+        **options,
+    )
+    assert 0 < len(segments) < len(no_speech_probs)
+    assert list(early_segments) == segments
+
+
+def test_loop_probe(model_path, jfk_path):
+    model = WhisperModel(model_path)
+    audio = np.tile(decode_audio(jfk_path), 4)
+    options = dict(without_timestamps=True, temperature=0.0)
+
+    segments, _ = model.transcribe(audio, **options)
+    segments = list(segments)
+    # too short to contain a loop, so the full decoding always runs
+    probe_segments, _ = model.transcribe(audio, loop_probe_length=16, **options)
+    assert list(probe_segments) == segments
+
+    decodings = []
+    generate_with_temperature = model.generate_with_temperature
+
+    def loop_at_temperature_0(
+        encoder_output, prompts, options, temperature, max_length, *args
+    ):
+        decodings.append((temperature, max_length - len(prompts[0])))
+        if temperature == 0:
+            return [
+                SimpleNamespace(
+                    sequences_ids=[[1000] * (max_length - len(prompts[0]))],
+                    scores=[0.0],
+                    no_speech_prob=0.0,
+                )
+            ]
+        return generate_with_temperature(
+            encoder_output, prompts, options, temperature, max_length, *args
+        )
+
+    model.generate_with_temperature = loop_at_temperature_0
+    probe_segments, _ = model.transcribe(
+        audio, loop_probe_length=32, temperature=[0.0, 0.5], without_timestamps=True
+    )
+    probe_segments = list(probe_segments)
+
+    # the looping attempts are not decoded further and use the next temperature
+    assert [decoding for decoding in decodings if decoding[0] == 0] == [(0.0, 32)] * 2
+    assert len(probe_segments) > 0
+    assert all(segment.temperature == 0.5 for segment in probe_segments)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_adaptive_beam(model_path, jfk_path, batched):
+    model = WhisperModel(model_path)
+    if batched:
+        model = BatchedInferencePipeline(model)
+    audio = np.tile(decode_audio(jfk_path), 4)
+    options = dict(
+        compression_ratio_threshold=None, no_speech_threshold=None, temperature=0.0
+    )
+
+    # the greedy results are kept when they pass all the checks
+    segments, _ = model.transcribe(
+        audio, beam_size=1, log_prob_threshold=None, **options
+    )
+    segments = list(segments)
+    adaptive_segments, _ = model.transcribe(
+        audio, beam_size=5, adaptive_beam=True, log_prob_threshold=None, **options
+    )
+    assert len(segments) > 0
+    assert list(adaptive_segments) == segments
+
+    # and all of them are decoded again with beam search when they fail
+    segments, _ = model.transcribe(audio, beam_size=5, log_prob_threshold=0, **options)
+    segments = list(segments)
+    adaptive_segments, _ = model.transcribe(
+        audio, beam_size=5, adaptive_beam=True, log_prob_threshold=0, **options
+    )
+    assert len(segments) > 0
+    assert list(adaptive_segments) == segments
+
+
+def test_cascade_without_escalation():
+    draft_segments = [make_segment(start, start + 5.0) for start in range(0, 20, 5)]
+    draft_model = StubModel(draft_segments)
+    model = StubModel()
+    cascade = ModelCascade(draft_model, model)
+
+    segments, info, cascade_info = cascade.transcribe(
+        np.zeros(20 * 16000, dtype=np.float32)
+    )
+
+    assert segments == [
+        replace(segment, id=idx) for idx, segment in enumerate(draft_segments, 1)
+    ]
+    assert info.language == "en"
+    assert cascade_info.num_escalated_segments == 0
+    assert model.calls == []
+
+
+def test_cascade_replaces_escalated_segments():
+    draft_segments = [
+        make_segment(0.0, 5.0, "kept"),
+        make_segment(5.0, 10.0, "doubtful", avg_logprob=-1.0),
+        make_segment(10.0, 15.0, "doubtful", avg_logprob=-1.0),
+        make_segment(15.0, 20.0, "kept"),
+        make_segment(20.0, 25.0, "doubtful", avg_logprob=-1.0),
+    ]
+    escalated_segments = [
+        make_segment(5.0, 15.0, "escalated"),
+        make_segment(20.0, 25.0, "escalated"),
+    ]
+    draft_model = StubModel(draft_segments, language="fr")
+    model = StubModel(escalated_segments)
+    cascade = ModelCascade(draft_model, model)
+
+    segments, _, cascade_info = cascade.transcribe(
+        np.zeros(25 * 16000, dtype=np.float32), beam_size=1
+    )
+
+    assert [(segment.id, segment.start, segment.text) for segment in segments] == [
+        (1, 0.0, "kept"),
+        (2, 5.0, "escalated"),
+        (3, 15.0, "kept"),
+        (4, 20.0, "escalated"),
+    ]
+    assert cascade_info.num_escalated_segments == 3
+    assert cascade_info.escalated_ranges == [(5.0, 15.0), (20.0, 25.0)]
+    # the larger model transcribes the escalated ranges in the detected language
+    assert model.calls == [
+        {"beam_size": 1, "language": "fr", "clip_timestamps": [5.0, 15.0, 20.0, 25.0]}
+    ]
+
+
+def test_router():
+    lid_model = StubModel(language="fr")
+    fr_model = StubModel([make_segment(0.0, 5.0, "fr")])
+    en_model = StubModel([make_segment(0.0, 5.0, "en")])
+    default_model = StubModel([make_segment(0.0, 5.0, "default")])
+    router = ModelRouter(lid_model, {"fr": fr_model, "en": en_model}, default_model)
+    audio = np.zeros(5 * 16000, dtype=np.float32)
+
+    segments, info = router.transcribe(audio, beam_size=1)
+    assert [segment.text for segment in segments] == ["fr"]
+    assert info.language == "fr"
+    assert info.language_probability == 0.9
+    assert info.all_language_probs == [("fr", 0.9)]
+    # the routed model does not detect the language again
+    assert fr_model.calls == [{"language": "fr", "beam_size": 1}]
+
+    segments, info = router.transcribe(audio, language="en")
+    assert [segment.text for segment in segments] == ["en"]
+    assert lid_model.num_detections == 1
+
+    lid_model.language = "de"
+    segments, info = router.transcribe(audio)
+    assert [segment.text for segment in segments] == ["default"]
+    assert default_model.calls == [{"language": "de"}]
+
+    router = ModelRouter(lid_model, {"fr": fr_model})
+    segments, info = router.transcribe(audio)
+    assert lid_model.calls == [{"language": "de"}]
+
+
+def test_router_shares_models_by_name(monkeypatch):
+    loaded_models = []
+
+    def load_model(model_size_or_path, **kwargs):
+        loaded_models.append((model_size_or_path, kwargs))
+        return StubModel()
+
+    monkeypatch.setattr("faster_whisper.transcribe.WhisperModel", load_model)
+    router = ModelRouter(
+        StubModel(),
+        {"fr": "small", "de": "small", "en": "tiny"},
+        model_options={"device": "cpu"},
+    )
+
+    assert router.get_model("fr") is router.get_model("de")
+    assert router.get_model("en") is not router.get_model("fr")
+    assert loaded_models == [("small", {"device": "cpu"}), ("tiny", {"device": "cpu"})]
+
+
+def test_router_requires_multilingual_model():
+    lid_model = StubModel()
+    lid_model.model = SimpleNamespace(is_multilingual=False)
+
+    with pytest.raises(ValueError):
+        ModelRouter(lid_model, {})
+
+
+def test_transcribe_multiple(model_path, jfk_path):
+    model = WhisperModel(model_path)
+    model.model = EncodeCountingModel(model.model)
+    audio = np.tile(decode_audio(jfk_path), 4)
+    options = [{"beam_size": 1}, {"beam_size": 5}, {"without_timestamps": True}]
+
+    separate_segments = []
+    for stream_options in options:
+        segments, _ = model.transcribe(audio, temperature=0.0, **stream_options)
+        separate_segments.append(list(segments))
+    num_encoded = model.model.num_encoded
+    model.model.num_encoded = 0
+
+    results = model.transcribe_multiple(audio, options, temperature=0.0)
+    # consume the transcriptions in lockstep
+    all_segments = [[] for _ in options]
+    for stream_segments in itertools.zip_longest(
+        *(segments for segments, _ in results)
+    ):
+        for segments, segment in zip(all_segments, stream_segments):
+            if segment is not None:
+                segments.append(segment)
+
+    assert all_segments == separate_segments
+    assert model.model.num_encoded < num_encoded
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_encoder_cache(model_path, jfk_path, tmp_path, batched):
+    whisper_model = WhisperModel(model_path)
+    whisper_model.model = EncodeCountingModel(whisper_model.model)
+    model = BatchedInferencePipeline(whisper_model) if batched else whisper_model
+    audio = np.tile(decode_audio(jfk_path), 4)
+    cache = EncoderOutputCache(str(tmp_path))
+
+    segments, _ = model.transcribe(audio, temperature=0.0)
+    segments = list(segments)
+    num_encoded = whisper_model.model.num_encoded
+
+    for expected_num_encoded in (num_encoded, 0):
+        whisper_model.model.num_encoded = 0
+        cached_segments, _ = model.transcribe(
+            audio, encoder_cache=cache, temperature=0.0
+        )
+        assert list(cached_segments) == segments
+        assert whisper_model.model.num_encoded == expected_num_encoded
+
+
+def test_encoder_cache_size_limit(tmp_path):
+    array = np.zeros((10, 100), dtype=np.float32)
+    cache = EncoderOutputCache(str(tmp_path), max_size=1024**3)
+    cache.put("a", array)
+    array_size = os.path.getsize(tmp_path / "a.npy")
+    assert cache.total_size == array_size
+
+    # overwriting an entry does not count it twice
+    cache.put("a", array)
+    assert cache.total_size == array_size
+
+    cache = EncoderOutputCache(str(tmp_path), max_size=int(3.5 * array_size))
+    assert cache.total_size == array_size
+    for mtime, key in enumerate(["a", "b", "c"], 1):
+        cache.put(key, array)
+        os.utime(tmp_path / ("%s.npy" % key), ns=(mtime, mtime))
+    assert cache.get("a") is not None
+
+    # the least recently used entry is removed, down to 90% of the limit
+    cache.put("d", array)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+    assert cache.total_size == 3 * array_size
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from faster_whisper import decode_audio, vad
+from faster_whisper.vad import (
+    SpeechTimestampsMap,
+    VadCache,
+    VadOptions,
+    get_speech_timestamps,
+)
+
+
+@pytest.fixture(scope="module")
+def speech_with_pauses(jfk_path):
+    jfk = decode_audio(jfk_path)
+    rng = np.random.default_rng(0)
+    parts = []
+    for _ in range(20):
+        parts.append(jfk)
+        parts.append(np.zeros(int(16000 * rng.uniform(0.5, 3.0)), dtype=np.float32))
+    return np.concatenate(parts)
+
+
+@pytest.mark.parametrize(
+    "shard_duration_s,shard_overlap_s", [(60, 5), (37, 2), (13, 1)]
+)
+def test_sharded_speech_timestamps(
+    speech_with_pauses, shard_duration_s, shard_overlap_s
+):
+    speech_chunks = get_speech_timestamps(speech_with_pauses, VadOptions())
+    sharded_speech_chunks = get_speech_timestamps(
+        speech_with_pauses,
+        VadOptions(
+            num_workers=4,
+            shard_duration_s=shard_duration_s,
+            shard_overlap_s=shard_overlap_s,
+        ),
+    )
+
+    assert len(sharded_speech_chunks) == len(speech_chunks)
+    for chunk, sharded_chunk in zip(speech_chunks, sharded_speech_chunks):
+        assert abs(sharded_chunk["start"] - chunk["start"]) <= 0.1 * 16000
+        assert abs(sharded_chunk["end"] - chunk["end"]) <= 0.1 * 16000
+
+
+def test_speech_timestamps_map_bulk_matches_scalar():
+    rng = np.random.default_rng(0)
+    boundaries = np.cumsum(rng.integers(1600, 160000, size=200))
+    chunks = [
+        {"start": int(start), "end": int(end)}
+        for start, end in zip(boundaries[::2], boundaries[1::2])
+    ]
+    ts_map = SpeechTimestampsMap(chunks, 16000)
+    speech_duration = sum(chunk["end"] - chunk["start"] for chunk in chunks) / 16000
+    times = np.round(np.arange(0, speech_duration, 0.02), 2)
+
+    for is_end in (False, True):
+        chunk_indices = ts_map.get_chunk_indices(times, is_end)
+        assert chunk_indices.tolist() == [
+            ts_map.get_chunk_index(time, is_end) for time in times.tolist()
+        ]
+        assert ts_map.get_original_times(times, chunk_indices).tolist() == [
+            ts_map.get_original_time(time, chunk_index)
+            for time, chunk_index in zip(times.tolist(), chunk_indices.tolist())
+        ]
+
+
+def test_vad_cache(speech_with_pauses, tmp_path, monkeypatch):
+    cache = VadCache(str(tmp_path))
+    vad_options = VadOptions(min_silence_duration_ms=500)
+    speech_chunks = get_speech_timestamps(speech_with_pauses, vad_options)
+    assert get_speech_timestamps(speech_with_pauses, vad_options, cache=cache) == (
+        speech_chunks
+    )
+
+    def get_vad_model():
+        raise AssertionError("the VAD model should not run on a cache hit")
+
+    monkeypatch.setattr(vad, "get_vad_model", get_vad_model)
+    assert get_speech_timestamps(speech_with_pauses, vad_options, cache=cache) == (
+        speech_chunks
+    )
+
+    other_options = VadOptions(min_silence_duration_ms=1000)
+    assert cache.get_key(speech_with_pauses, other_options, 16000) != cache.get_key(
+        speech_with_pauses, vad_options, 16000
+    )
+    sharded_keys = {
+        cache.get_key(speech_with_pauses, VadOptions(num_workers=workers), 16000)
+        for workers in (1, 2, 4)
+    }
+    assert len(sharded_keys) == 2